@@ -1,17 +1,20 @@
 import re
 import streamlit as st
 from utils import documentSearch
-from utils.ai import ai_completion
-from utils.doi import get_apa_citation
+from utils.llm_stream import stream_completion, stream_many
+from utils.doi import get_apa_citation, get_apa_citations
+from utils.stream_render import StreamRenderer, render_stream
 from utils.funcs import pin_piece, unpin_piece, add_to_lit_review, remove_from_lit_review
 from pandas import read_csv
-import json
 import requests
 import pandas as pd
 from datetime import datetime
 from utils.session_state_vars import bulk_search_column_order, bulk_search_column_config
 from tabs.css import css_code
 
+# summaries streamed at the same time by "Summarize All Results"
+SUMMARY_CONCURRENCY = 8
+
 
 @st.cache_data
 def get_journal_names():
@@ -58,30 +61,50 @@ def generate_completion(article):
     )
 
     try:
-        response = ai_completion(
+        report = []
+        for delta in stream_completion(
             messages=prompt,
             model=st.session_state.selected_model,
             temperature=0.3,
-            # max_tokens=1500,
-            stream=True,
-        )
-        collected_chunks = []
-        report = []
-        for line in response.iter_lines():
-            if line and 'data' in line.decode('utf-8'):
-                content = line.decode('utf-8').replace('data: ', '')
-                if 'content' in content:
-                    message = json.loads(content, strict=False)
-                    collected_chunks.append(message)  # save the event response
-                    report.append(message['choices'][0]['delta']['content'])
-                    st.session_state.last_response = "".join(report).strip()
-                    yield st.session_state.last_response
+        ):
+            report.append(delta)
+            yield delta
+        st.session_state.last_response = "".join(report).strip()
 
     except Exception as e:
         st.error(f"The AI is not responding. Please try again or choose another model.")
         st.stop()
 
 
+def generate_completions(articles, placeholders):
+    """
+    Stream the summaries of several articles at once, each into its own placeholder
+    :param articles: the articles to summarize
+    :param placeholders: the st.empty() placeholder of each article
+    """
+    # resolve the missing citations in one batch
+    get_apa_citations(articles)
+
+    for start in range(0, len(articles), SUMMARY_CONCURRENCY):
+        batch = articles[start:start + SUMMARY_CONCURRENCY]
+        prompts = []
+        for article in batch:
+            citation = st.session_state.citations.get(article['id']) or f"{article['authors']} ({article['year']})"
+            article['citation'] = [citation]
+            prompts.append(prep_gpt_summary(article))
+
+        renderers = [StreamRenderer(placeholder) for placeholder in placeholders[start:start + SUMMARY_CONCURRENCY]]
+        try:
+            for index, delta in stream_many(prompts, model=st.session_state.selected_model, temperature=0.3):
+                renderers[index].write(delta)
+        except Exception as e:
+            st.error(f"The AI is not responding. Please try again or choose another model.")
+            st.stop()
+
+        for article, renderer in zip(batch, renderers):
+            st.session_state.summaries[article['id']] = renderer.finish()
+
+
 def sort_results(sort_method):
     if st.session_state.article_search_results is not None:
         if sort_method == 'Relevance':
@@ -141,10 +164,17 @@ def article_search():
                 step=1,
                 key="year")
 
+            # article counts within the selected years, when the facet index is ready
+            facet_counts = documentSearch.library_facet_counts(st.session_state.year)
             st.multiselect(
                 label="**Select Journals** (leave empty for all journals)",
                 options=get_journal_names(),
-                format_func=lambda x: f"{x['journal']} ({x['number_of_articles']} articles)",
+                format_func=lambda x: (
+                    f"{x['journal']} ({facet_counts.get(x['journal'], 0)} articles in "
+                    f"{st.session_state.year[0]}-{st.session_state.year[1]})"
+                    if facet_counts is not None
+                    else f"{x['journal']} ({x['number_of_articles']} articles)"
+                ),
                 key='selected_journal',
                 disabled=False
             )
@@ -230,6 +260,15 @@ def article_search():
                 st.toast("No articles found. Please try again.", icon="❗")
 
         # display the articles
+    summarize_all = False
+    if st.session_state.article_search_results:
+        summarize_all = st.button(
+            label="Summarize All Results",
+            key="summarize_all_results",
+            type='secondary',
+            use_container_width=True
+        )
+
     with st.container(height=500):
         if not st.session_state.article_search_results:
             st.markdown("Search Results will be displayed here.")
@@ -292,6 +331,12 @@ def article_search():
                 if st.session_state[f"regenerate_{article['id']}"]:
                     index = 1
 
+                # show the summary after "Summarize All Results"; the radio can
+                # only be switched before it is created
+                if article['id'] in st.session_state.get('show_summaries_for', set()):
+                    st.session_state.show_summaries_for.discard(article['id'])
+                    st.session_state[f"radio_{article['id']}"] = 'Summary'
+
                 st.radio(
                     label="Abstract or Summary",
                     options=['Abstract', 'Summary'],
@@ -314,8 +359,10 @@ def article_search():
                     if st.session_state[f"regenerate_{article['id']}"]:
                         # stream the summary in the box
                         with st.session_state[f"{article['id']}_container"]:
-                            for response_chunk in generate_completion(article=article):
-                                st.session_state[f"{article['id']}_container"].markdown(f'{response_chunk}')
+                            render_stream(
+                                st.session_state[f"{article['id']}_container"],
+                                generate_completion(article=article),
+                            )
 
                         # save the summary in the session state
                         st.session_state.summaries[article['id']] = st.session_state.last_response
@@ -342,8 +389,10 @@ def article_search():
 
                             # stream the summary in the box
                             with st.session_state[f"{article['id']}_container"]:
-                                for response_chunk in generate_completion(article=article):
-                                    st.session_state[f"{article['id']}_container"].markdown(f'{response_chunk}')
+                                render_stream(
+                                    st.session_state[f"{article['id']}_container"],
+                                    generate_completion(article=article),
+                                )
 
                             # save the summary in the session state
                             st.session_state.summaries[article['id']] = st.session_state.last_response
@@ -356,6 +405,23 @@ def article_search():
 
                 st.markdown('---')
 
+            # stream the summaries that are missing into their placeholders together
+            if summarize_all:
+                pending = [
+                    article for article in st.session_state.article_search_results
+                    if article['id'] not in st.session_state.summaries.keys()
+                ]
+                if pending:
+                    generate_completions(
+                        pending,
+                        [st.session_state[f"{article['id']}_container"] for article in pending]
+                    )
+                # switch every result to its summary on the next run
+                st.session_state.show_summaries_for = {
+                    article['id'] for article in st.session_state.article_search_results
+                }
+                st.rerun()
+
                 # st.write(st.session_state)
 
 
@@ -1,5 +1,7 @@
 import streamlit as st
-from utils.ai import ai_completion
+from utils.llm_stream import stream_completion
+from utils.stream_render import render_stream
+from utils.context_assembler import assemble_context, collect_context_items
 from utils.funcs import (
     pin_piece,
     add_rag_document_to_context, remove_rag_document_from_context,
@@ -7,7 +9,6 @@ from utils.funcs import (
     get_rag_context_summary
 )
 from utils.session_state_vars import ensure_session_state_vars
-import json
 import time
 from tabs import article_search
 from utils.local_storage import (
@@ -216,6 +217,14 @@ def render_context_panel():
                     if st.button("Remove from RAG", key=f"remove_rag_{i}", type="secondary"):
                         remove_rag_document_from_context(doc)
                         st.rerun()
+
+                # delete this user's uploads from the shared store, not just from the context
+                if st.button("🗑️ Delete My Uploaded PDFs", key="clear_rag_documents", type="secondary"):
+                    from utils.rag_manager import get_rag_manager
+                    if get_rag_manager().clear_all_documents():
+                        for doc in list(st.session_state.rag_documents):
+                            remove_rag_document_from_context(doc)
+                        st.rerun()
     
     # Context management
     if context_items > 0:
@@ -248,28 +257,21 @@ def process_multiple_pdfs(uploaded_files, doi_input):
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        for i, uploaded_file in enumerate(uploaded_files):
-            try:
-                status_text.text(f"Processing {uploaded_file.name}...")
-                progress_bar.progress((i + 1) / total_files)
-                
-                # Reset file pointer to beginning
-                uploaded_file.seek(0)
-                
-                # Add PDF to RAG system
-                result = rag_manager.add_pdf_to_rag(uploaded_file, doi_input if i == 0 else None)
-                
-                if result['success']:
-                    # Add document to context (abstract only)
-                    add_rag_document_to_context(result['document'])
-                    success_count += 1
-                    st.success(f"✅ {uploaded_file.name}: Successfully processed")
-                else:
-                    st.error(f"❌ {uploaded_file.name}: {result['message']}")
-                    
-            except Exception as file_error:
-                st.error(f"❌ {uploaded_file.name}: Error processing file - {str(file_error)}")
-                continue
+        status_text.text(f"Processing {total_files} PDF(s)...")
+
+        # Files are ingested concurrently; results arrive as each one finishes
+        results = rag_manager.add_pdfs_to_rag(uploaded_files, doi_input)
+        for done, (uploaded_file, result) in enumerate(results, start=1):
+            progress_bar.progress(done / total_files)
+            status_text.text(f"Processed {done}/{total_files}: {uploaded_file.name}")
+
+            if result['success']:
+                # Add document to context (abstract only)
+                add_rag_document_to_context(result['document'])
+                success_count += 1
+                st.success(f"✅ {uploaded_file.name}: Successfully processed")
+            else:
+                st.error(f"❌ {uploaded_file.name}: {result['message']}")
         
         progress_bar.empty()
         status_text.empty()
@@ -297,8 +299,13 @@ def handle_user_input(user_input, chat_container):
                 from utils.rag_manager import get_rag_manager
                 rag_manager = get_rag_manager()
                 
-                # Query RAG system for relevant content
-                rag_results = rag_manager.query_rag(user_input, top_k=5)
+                # Query only the documents this session has added, not
+                # every user's chunks in the shared store
+                rag_results = rag_manager.query_rag(
+                    user_input,
+                    top_k=5,
+                    doc_ids=[doc['id'] for doc in st.session_state.rag_documents]
+                )
                 
                 if rag_results['success'] and rag_results['results']:
                     # Add RAG results to context
@@ -329,10 +336,17 @@ def handle_user_input(user_input, chat_container):
                 response = generate_ai_response(user_input, context)
                 
                 # Stream response
-                full_response = ""
-                for chunk in response:
-                    full_response += chunk
-                    response_placeholder.markdown(full_response)
+                full_response = render_stream(response_placeholder, response)
+
+            # tell the user when the context did not fit in the model's budget
+            context_report = st.session_state.pop('context_report', None)
+            if context_report is not None and not context_report.complete:
+                st.caption(f"⚠️ {context_report.summary()}")
+                with st.expander("Context left out of this answer"):
+                    for label in context_report.truncated:
+                        st.markdown(f"• ✂️ {label}")
+                    for label in context_report.dropped:
+                        st.markdown(f"• ❌ {label}")
         
         # Add assistant message
         st.session_state.messages_to_interface.append({
@@ -364,8 +378,18 @@ def generate_ai_response(user_input, context):
         yield "Once you add papers to your context, I can help you analyze and synthesize the research!"
         return
     
-    # Prepare context
-    context_text = '\n'.join(context) if context else 'No specific context provided'
+    # Prepare context: fit the full study texts into the model's token budget
+    context_items = collect_context_items(
+        api_context=st.session_state.messages_to_api_context,
+        rag_results=st.session_state.get('rag_query_results', []),
+        rag_abstracts=st.session_state.get('rag_abstracts', []),
+        query=user_input,
+    )
+    selected_context, st.session_state.context_report = assemble_context(
+        context_items,
+        model=st.session_state.selected_model,
+    )
+    context_text = '\n\n'.join(selected_context) if selected_context else 'No specific context provided'
     
     # Improved system prompt
     system_prompt = """You are AIRA, an AI Research Assistant specializing in literature review and research synthesis. 
@@ -398,22 +422,11 @@ Please provide a comprehensive response based on the research papers provided.
     ]
     
     try:
-        response = ai_completion(
+        yield from stream_completion(
             messages=messages,
             model=st.session_state.selected_model,
             temperature=0.3,
-            stream=True,
         )
-        
-        for line in response.iter_lines():
-            if line and 'data' in line.decode('utf-8'):
-                content = line.decode('utf-8').replace('data: ', '')
-                if 'content' in content:
-                    message = json.loads(content, strict=False)
-                    if 'choices' in message and len(message['choices']) > 0:
-                        delta = message['choices'][0].get('delta', {})
-                        if 'content' in delta:
-                            yield delta['content']
                             
     except Exception as e:
         yield f"❌ Error: The AI service is not responding. Please try again or select a different model: {str(e)}"
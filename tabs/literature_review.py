@@ -1,10 +1,10 @@
 import re
 import datetime
 import streamlit as st
-from utils.ai import ai_completion
-from utils.doi import get_apa_citation
+from utils.llm_stream import stream_completion
+from utils.doi import get_apa_citations
+from utils.stream_render import render_stream
 from typing import Optional
-import json
 from utils.funcs import show_pin_buttons
 
 
@@ -23,14 +23,16 @@ def lit_review_message(
     :return: list of messages to send to the OpenAI API
     :rtype: list
     """
+    # resolve the missing citations together instead of one round trip per article
+    get_apa_citations([article for article in articles if not article.get('citation')])
+
     all_articles = []
     for article in articles:
-        # if citation is not already in the session state, get it
+        # the batch above already tried every missing citation; articles it could
+        # not resolve are cited by authors and year instead of asking again
         article_citation = article.get('citation', st.session_state.citations.get(article['id'], None))
         if not article_citation:
-            get_apa_citation(article)
-            article_citation = st.session_state.citations.get(article['id'], None)
-            article['citation'] = [article_citation]
+            article_citation = f"{article.get('authors', 'Unknown Authors')} ({article.get('year', 'n.d.')})"
 
         if isinstance(article_citation, list):
             article_citation = "\n".join(article_citation)
@@ -83,24 +85,15 @@ def generate_review(articles, user_input: str):
 
     try:
         # generate the response for lit review
-        response = ai_completion(
+        report = []
+        for delta in stream_completion(
             messages=prompt,
             model=st.session_state.selected_model,
             temperature=0.3,
-            # max_tokens=5000,
-            stream=True,
-        )
-        collected_chunks = []
-        report = []
-        for line in response.iter_lines():
-            if line and 'data' in line.decode('utf-8'):
-                content = line.decode('utf-8').replace('data: ', '')
-                if 'content' in content:
-                    message = json.loads(content, strict=False)
-                    collected_chunks.append(message)  # save the event response
-                    report.append(message['choices'][0]['delta']['content'])
-                    st.session_state.last_review = "".join(report).strip()
-                    yield st.session_state.last_review
+        ):
+            report.append(delta)
+            yield delta
+        st.session_state.last_review = "".join(report).strip()
     except Exception as e:
         st.error(f"The AI is not responding. Please try again or choose another model.")
         st.stop()
@@ -160,12 +153,14 @@ def literature_review():
             # stream the summary in the box
             with ai_response:
                 msg = st.toast("AI is thinking...", icon="🧠")
-                for response_chunk in generate_review(
+                render_stream(
+                    ai_response,
+                    generate_review(
                         articles=st.session_state.review_pieces,
                         user_input=user_input
-                ):
-                    msg.toast("AI is talking...", icon="🤖")
-                    ai_response.markdown(f'{response_chunk}')
+                    ),
+                    on_start=lambda: msg.toast("AI is talking...", icon="🤖"),
+                )
 
             st.toast("AI is done talking...", icon="✔️")
 
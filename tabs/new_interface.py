@@ -1,11 +1,11 @@
 import streamlit as st
-from utils.ai import ai_completion
+from utils.llm_stream import stream_completion
 from utils.funcs import (
     set_command_none,
     pin_piece
 )
 from utils.session_state_vars import ensure_session_state_vars
-import json
+from utils.stream_render import render_stream
 from tabs import sidebar
 import time
 from tabs.css import css_code
@@ -73,25 +73,15 @@ def chat_response(
             )
              }]
         try:
-            response = ai_completion(
+            report = []
+            for delta in stream_completion(
                 messages=messages,
                 model=st.session_state.selected_model,
                 temperature=0.1,  # st.session_state.temperature,
-                # max_tokens=1000,
-                stream=True,
-            )
-
-            collected_chunks = []
-            report = []
-            for line in response.iter_lines():
-                if line and 'data' in line.decode('utf-8'):
-                    content = line.decode('utf-8').replace('data: ', '')
-                    if 'content' in content:
-                        message = json.loads(content, strict=False)
-                        collected_chunks.append(message)  # save the event response
-                        report.append(message['choices'][0]['delta']['content'])
-                        st.session_state.last_review = "".join(report).strip()
-                        yield st.session_state.last_review
+            ):
+                report.append(delta)
+                yield delta
+            st.session_state.last_review = "".join(report).strip()
         except Exception as e:
             st.error(f"The AI is not responding. Please try again or choose another model.")
             st.stop()
@@ -130,25 +120,15 @@ def chat_response(
          },
     )
     try:
-        response = ai_completion(
+        report = []
+        for delta in stream_completion(
             messages=st.session_state.messages_to_api,
             model=st.session_state.selected_model,
             temperature=0.3,  # st.session_state.temperature,
-            # max_tokens=4000,
-            stream=True,
-        )
-
-        collected_chunks = []
-        report = []
-        for line in response.iter_lines():
-            if line and 'data' in line.decode('utf-8'):
-                content = line.decode('utf-8').replace('data: ', '')
-                if 'content' in content:
-                    message = json.loads(content, strict=False)
-                    collected_chunks.append(message)  # save the event response
-                    report.append(message['choices'][0]['delta']['content'])
-                    st.session_state.last_review = "".join(report).strip()
-                    yield st.session_state.last_review
+        ):
+            report.append(delta)
+            yield delta
+        st.session_state.last_review = "".join(report).strip()
     except Exception as e:
         st.error(f"The AI is not responding. Please try again or choose another model.")
         st.stop()
@@ -264,12 +244,14 @@ def new_interface():
                 ai_response = st.empty()
 
                 msg = st.toast("AI is thinking...", icon="🧠")
-                for response_chunk in chat_response(
+                response_chunk = render_stream(
+                    ai_response,
+                    chat_response(
                         instructions=user_input,
                         context=st.session_state.messages_to_api_context,
-                ):
-                    msg.toast("AI is talking...", icon="🤖")
-                    ai_response.markdown(f'{response_chunk}')
+                    ),
+                    on_start=lambda: msg.toast("AI is talking...", icon="🤖"),
+                )
 
         st.session_state.messages_to_interface.append({"role": "assistant", "content": response_chunk})
         st.session_state.messages_to_api.append({"role": "assistant", "content": response_chunk})
@@ -1,31 +1,9 @@
 import streamlit as st
-from utils.doi import get_citation
-from pypdf import PdfReader
-from utils.text_splitter import CharacterTextSplitter
-from utils.ai import ai_completion
+from utils.llm_stream import stream_completion
+from utils.stream_render import render_stream
 from utils.funcs import show_pin_buttons
-import json
+from utils.rag_manager import get_rag_manager
 import time
-import chromadb
-from utils.documentSearch import openai_ef
-from ast import literal_eval
-
-text_splitter = CharacterTextSplitter(
-    separator="\n",
-    chunk_size=2000,
-    chunk_overlap=100
-)
-
-
-@st.cache_resource
-def get_chromadb_running():
-    st.session_state.memory_client = chromadb.Client()
-    # memory_client.delete_collection("pdf")
-    st.session_state.memory_collection = st.session_state.memory_client.get_or_create_collection(
-        "pdf",
-        embedding_function=openai_ef
-    )
-    return st.session_state.memory_collection
 
 
 def pdf_quick_summary(
@@ -125,64 +103,9 @@ def pdf_q_and_a(
     return messages
 
 
-def get_pdf_text(file) -> []:
-    file = PdfReader(file)
-    # create a vector store
-    this_pdf = []
-    for page in range(len(file.pages)):
-
-        this_page = file.pages[page].extract_text()
-        docs = text_splitter.create_documents([this_page])
-        for text in docs:
-            text.metadata['page_number'] = page
-            text.metadata['part_number'] = docs.index(text)
-
-        this_pdf += docs
-
-    return {'texts': this_pdf, 'num_pages': len(file.pages)}
-
-
-def get_citation_from_pdf(pdf) -> str:
-    # combine the first two pages
-    first_two_pages = " ".join([item.page_content for item in pdf['texts'][:2]])
-    prompt = ("generate apa citation from this content which is from the first two pages of a pdf file in a python list where the first "
-              "element is for the bibliography and the second item is for in-line citations, just give me a list and nothing else! Avoid "
-              f"explaining yourself. : <content>{first_two_pages}<content>")
-    try:
-        response = ai_completion(
-            messages=[{"role": "user", "content": prompt}],
-            model='openai/gpt-4',
-            temperature=0,  # st.session_state.temperature,
-            # max_tokens=300,
-            stream=False,
-        )
-        citation_from_text = response.json()['choices'][0]['message']['content'].lower()
-        # find the list in response based on the presence of []
-        citation_from_text = citation_from_text[citation_from_text.find('['):citation_from_text.find(']')+1]
-        # get citation from text as a list
-        citation_from_text = literal_eval(citation_from_text)
-        return citation_from_text
-    except Exception as e:
-        st.error(f"The AI is not responding. Please try again or choose another model.")
-        st.stop()
-
-
-@st.cache_data(show_spinner=False)
-def add_docs_to_db(_fulltext, _doi_to_add, _pdf_collection):
-    _pdf_collection.add(
-        documents=[item.page_content for item in _fulltext],
-        metadatas=[{'doi_id': _doi_to_add['doi_id'], **item.metadata} for item in _fulltext],
-        ids=["-".join([_doi_to_add['doi_id'],
-                       'page',
-                       str(item.metadata['page_number']),
-                       str(item.metadata['part_number'])]
-                      ) for item in _fulltext]
-    )
-
-
 def pdf_search():
-    if 'pdf_collection' not in st.session_state:
-        st.session_state.pdf_collection = get_chromadb_running()
+    # PDFs are stored in the shared RAG engine, together with the chat uploads
+    rag_manager = get_rag_manager()
 
     st.subheader("PDF Article Search")
 
@@ -258,47 +181,41 @@ def pdf_search():
                     msg = st.toast(
                         f"**Importing the article. Please wait...**", icon="⌛"
                     )
-                    fulltext = get_pdf_text(uploaded_file)['texts']
-                    time.sleep(0.5)
                     msg.toast("**getting the citation...**", icon="📑")
+                    result = rag_manager.add_pdf_to_rag(uploaded_file, st.session_state.pdf_doi_input)
+                    if not result['success']:
+                        st.error(result['message'])
+                        st.stop()
+
+                    document = result['document']
+                    citation = document['citation']
                     if st.session_state.pdf_doi_input is None:
-                        try:
-                            citation = get_citation_from_pdf(get_pdf_text(uploaded_file))[0]
-                            doi = get_citation_from_pdf(get_pdf_text(uploaded_file))[1]
-                            if doi in dois_present:
-                                st.toast(
-                                    f"**This article has already been imported!**", icon="😎"
-                                )
-                                st.rerun()
-                        except Exception as e:
-                            st.error('Could not get citation from pdf. Please try again.')
-                            st.stop()
+                        # the DOI detected in the PDF, or an ID derived from its content
+                        doi = document['doi']
+                        if doi in dois_present:
+                            st.toast(
+                                f"**This article has already been imported!**", icon="😎"
+                            )
+                            st.rerun()
                     else:
-                        citation = get_citation(st.session_state.pdf_doi_input)
                         doi = st.session_state.pdf_doi_input
                     # create pdf object to save in the session state
                     doi_to_add = {
                         'doi': doi,
                         'citation': [citation],
-                        'intro': [page.page_content for page in fulltext[:2]],
-                        'num_pages': get_pdf_text(uploaded_file)['num_pages'],
+                        'intro': rag_manager.get_document_chunks(document['id'], limit=2),
+                        'num_pages': document['num_pages'],
                         'id': int(time.time()),
-                        'doi_id': ''.join(doi.split("/")[1:]),
+                        'doi_id': document['id'],
                         'pieces': []
                     }
 
-                    if doi_to_add['doi_id'] == '':
-                        doi_to_add['doi_id'] = doi_to_add['id']
-
                     msg.toast("**saving the article...**", icon="💾")
 
                     dois_present = [d['doi'] for d in st.session_state['pdf_history']]
                     if doi_to_add['doi'] not in dois_present:
                         st.session_state['pdf_history'].append(doi_to_add)
 
-                        # add docs to the chromadb
-                        add_docs_to_db(fulltext, doi_to_add, st.session_state.pdf_collection)
-
                     st.rerun()
 
                 except Exception as e:
@@ -377,26 +294,16 @@ def pdf_search():
 
                         msg = st.toast("AI is thinking...", icon="🧠")
                         try:
-                            response = ai_completion(
-                                messages=prompt,
-                                model=st.session_state.selected_model,
-                                temperature=0.3,  # st.session_state.temperature,
-                                # max_tokens=3000,
-                                stream=True,
-                            )
-                            collected_chunks = []
-                            report = []
                             with response_area.container():
-                                for line in response.iter_lines():
-                                    msg.toast("AI is talking...", icon="🤖")
-                                    if line and 'data' in line.decode('utf-8'):
-                                        content = line.decode('utf-8').replace('data: ', '')
-                                        if 'content' in content:
-                                            message = json.loads(content, strict=False)
-                                            collected_chunks.append(message)  # save the event response
-                                            report.append(message['choices'][0]['delta']['content'])
-                                            st.session_state.last_pdf_response = "".join(report).strip()
-                                            response_area.markdown(f'{st.session_state.last_pdf_response}')
+                                st.session_state.last_pdf_response = render_stream(
+                                    response_area,
+                                    stream_completion(
+                                        messages=prompt,
+                                        model=st.session_state.selected_model,
+                                        temperature=0.3,  # st.session_state.temperature,
+                                    ),
+                                    on_start=lambda: msg.toast("AI is talking...", icon="🤖"),
+                                )
 
                             st.toast("AI is done talking...", icon="✔️")
 
@@ -426,11 +333,14 @@ def pdf_search():
                     if submit_question:
                         if st.session_state.pdf_qa_input != '':
 
-                            query_results = st.session_state.pdf_collection.query(
-                                query_texts=st.session_state.pdf_qa_input,
-                                where={"doi_id": st.session_state.current_pdf['doi_id']},
-                                n_results=3
+                            rag_results = rag_manager.query_rag(
+                                st.session_state.pdf_qa_input,
+                                top_k=3,
+                                doc_ids=[st.session_state.current_pdf['doi_id']]
                             )
+                            query_results = {
+                                'documents': [[item['content'] for item in rag_results['results']]]
+                            }
 
                             prompt = pdf_q_and_a(
                                 query=query_results,
@@ -440,26 +350,16 @@ def pdf_search():
 
                             msg = st.toast("AI is thinking...", icon="🧠")
                             try:
-                                response = ai_completion(
-                                    messages=prompt,
-                                    model=st.session_state.selected_model,
-                                    temperature=0.3,  # st.session_state.temperature,
-                                    # max_tokens=3000,
-                                    stream=True,
-                                )
-                                collected_chunks = []
-                                report = []
                                 with response_area.container():
-                                    for line in response.iter_lines():
-                                        msg.toast("AI is talking...", icon="🤖")
-                                        if line and 'data' in line.decode('utf-8'):
-                                            content = line.decode('utf-8').replace('data: ', '')
-                                            if 'content' in content:
-                                                message = json.loads(content, strict=False)
-                                                collected_chunks.append(message)  # save the event response
-                                                report.append(message['choices'][0]['delta']['content'])
-                                                st.session_state.last_pdf_response = "".join(report).strip()
-                                                response_area.markdown(f'{st.session_state.last_pdf_response}')
+                                    st.session_state.last_pdf_response = render_stream(
+                                        response_area,
+                                        stream_completion(
+                                            messages=prompt,
+                                            model=st.session_state.selected_model,
+                                            temperature=0.3,  # st.session_state.temperature,
+                                        ),
+                                        on_start=lambda: msg.toast("AI is talking...", icon="🤖"),
+                                    )
 
                                 st.toast("AI is done talking...", icon="✔️")
 
@@ -1,7 +1,56 @@
 import requests
+from requests.adapters import HTTPAdapter
 import streamlit as st
 from tenacity import retry, wait_random, stop_after_attempt
 
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# seconds to wait for the connection and between bytes of the response;
+# override with OPENROUTER_CONNECT_TIMEOUT / OPENROUTER_READ_TIMEOUT in secrets
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 120
+
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """
+    Keep-alive HTTP session shared by all reruns and sessions of the app.
+
+    Connections to OpenRouter are pooled, so chat turns, citation extraction
+    and summaries reuse an open TLS connection instead of handshaking again.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_timeouts() -> tuple:
+    return (
+        float(st.secrets.get("OPENROUTER_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+        float(st.secrets.get("OPENROUTER_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)),
+    )
+
+
+def openrouter_headers() -> dict:
+    return {
+        'Accept': 'text/event-stream',  # This is the key to streaming
+        'Authorization': 'Bearer ' + st.secrets['OPENROUTER_API_KEY'],
+        'HTTP-Referer': st.secrets['OPENROUTER_REFERRER'],
+        'X-Title': st.secrets['APP_TITLE'],
+    }
+
+
+def completion_body(messages: list, model: str, temperature: float, stream: bool) -> dict:
+    return {
+        'model': model,
+        'messages': messages,
+        # 'max_tokens': max_tokens,
+        'temperature': temperature,
+        'top_p': 1,
+        'stream': stream,
+    }
+
 
 @retry(wait=wait_random(min=2, max=10), stop=stop_after_attempt(5))
 def ai_completion(
@@ -23,33 +72,23 @@ def ai_completion(
     :return: The response from the API.
     """
 
-    headers = {
-        'Accept': 'text/event-stream',  # This is the key to streaming
-        'Authorization': 'Bearer ' + st.secrets['OPENROUTER_API_KEY'],
-        'HTTP-Referer': st.secrets['OPENROUTER_REFERRER'],
-        'X-Title': st.secrets['APP_TITLE'],
-    }
-
-    body = {
-        'model': model,
-        'messages': messages,
-        # 'max_tokens': max_tokens,
-        'temperature': temperature,
-        'top_p': 1,
-        'stream': stream,
-    }
+    headers = openrouter_headers()
+    body = completion_body(messages, model, temperature, stream)
 
     # Show a spinner while the AI is thinking
     # with st.spinner(text='AI is thinking...'):
-    response = requests.request(
-        url="https://openrouter.ai/api/v1/chat/completions",
-        method='POST',
+    response = get_http_session().post(
+        url=OPENROUTER_URL,
         headers=headers,
         json=body,
         stream=stream,
+        timeout=get_timeouts(),
     )
 
     if response.status_code != 200:
-        raise f"""Error: Unable to get response from the server. \n\n {response.status_code, response.text}"""
+        error = f"""Error: Unable to get response from the server. \n\n {response.status_code, response.text}"""
+        # release the pooled connection before retrying
+        response.close()
+        raise Exception(error)
     else:
         return response
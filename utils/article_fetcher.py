@@ -0,0 +1,159 @@
+import html
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import streamlit as st
+from utils.citation_resolver import (
+    DEFAULT_MAX_WORKERS,
+    CrossrefClient,
+    get_crossref_client,
+    normalize_doi,
+)
+from utils.storage import SQLITE_LOOKUP_BATCH, data_path, open_sqlite
+
+CROSSREF_WORKS_URL = "https://api.crossref.org/works/"
+
+# seconds to wait for the connection and for the metadata
+ARTICLE_TIMEOUT = (5, 30)
+
+_TAG = re.compile(r"<[^>]+>")
+
+
+def abstract_text(markup: str) -> str:
+    """The plain text of a Crossref (JATS) abstract"""
+    return " ".join(html.unescape(_TAG.sub(" ", markup)).split())
+
+
+def article_from_work(doi: str, work: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the article dict the search tabs display from a Crossref work.
+
+    :param doi: the DOI as it was requested, which the article ID is made from
+    :param work: the 'message' of a Crossref works response
+    :raises KeyError: when the work has no abstract, title or journal
+    """
+    return {
+        'text': abstract_text(work['abstract']),
+        'year': str(work['published']['date-parts'][0][0]).strip(),
+        'cite_counts': '',
+        'title': work['title'][0].strip(),
+        'journal': work['container-title'][0].strip(),
+        'doi': work['URL'].strip(),
+        'id': doi.replace('https://doi.org/', '').replace('/', '-').strip(),
+        'authors': ', '.join(author['family'] for author in work.get('author', []) if 'family' in author),
+        'type': 'abstract'
+    }
+
+
+class ArticleCache:
+    """Persistent store of the articles fetched from Crossref, keyed by normalized DOI"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or data_path("article_cache.sqlite3")
+        self._conn, self._lock = open_sqlite(
+            self.path,
+            "CREATE TABLE IF NOT EXISTS articles ("
+            "doi TEXT PRIMARY KEY, "
+            "data TEXT NOT NULL);"
+        )
+
+    def get_many(self, dois: List[str]) -> Dict[str, Dict[str, Any]]:
+        found = {}
+        unique = list(dict.fromkeys(dois))
+        with self._lock:
+            for start in range(0, len(unique), SQLITE_LOOKUP_BATCH):
+                batch = unique[start:start + SQLITE_LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT doi, data FROM articles WHERE doi IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((doi, json.loads(data)) for doi, data in rows)
+        return found
+
+    def put(self, doi: str, article: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO articles (doi, data) VALUES (?, ?)", (doi, json.dumps(article))
+            )
+            self._conn.commit()
+
+
+class ArticleFetcher:
+    """
+    Fetches the metadata and abstracts of many DOIs from Crossref at once.
+
+    Lookups run concurrently on a bounded pool through the CrossrefClient the
+    citation resolver uses, so the two share one session and one rate limit.
+    Parsed articles are kept in an ArticleCache on disk, so a DOI is only
+    fetched once.
+    """
+
+    def __init__(self, cache: Optional[ArticleCache] = None, client: Optional[CrossrefClient] = None,
+                 max_workers: int = DEFAULT_MAX_WORKERS):
+        """
+        :param cache: the article cache; defaults to one in the data directory
+        :param client: the Crossref client; defaults to one of its own
+        :param max_workers: DOIs fetched at the same time
+        """
+        self.cache = cache or ArticleCache()
+        self.client = client or CrossrefClient(max_workers=max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crossref")
+
+    def _fetch(self, doi: str) -> Dict[str, Any]:
+        key = normalize_doi(doi)
+        try:
+            response = self.client.get(
+                CROSSREF_WORKS_URL + key,
+                params={'mailto': self.client.mailto} if self.client.mailto else None,
+                timeout=ARTICLE_TIMEOUT
+            )
+            response.raise_for_status()
+            article = article_from_work(doi, response.json()['message'])
+        except Exception:
+            raise Exception(f'Could not get {doi}: Please ensure the doi is correct. if the error persists try uploading the PDF.')
+        self.cache.put(key, article)
+        return article
+
+    def iter_articles(self, dois: Iterable[str]) -> Iterator[Tuple[str, Optional[Dict[str, Any]], Optional[Exception]]]:
+        """
+        Yield each DOI's article as soon as it is available.
+
+        Cached articles come first, then fetched ones in the order they
+        complete; a DOI that cannot be fetched yields its error instead, so
+        one bad DOI never holds back the others.
+
+        :param dois: DOIs or doi.org URLs
+        :return: (doi, article, None) or (doi, None, error) for each DOI
+        """
+        dois = list(dict.fromkeys(dois))
+        cached = self.cache.get_many([normalize_doi(doi) for doi in dois])
+        missing = []
+        for doi in dois:
+            article = cached.get(normalize_doi(doi))
+            if article:
+                yield doi, article, None
+            else:
+                missing.append(doi)
+
+        futures = {self._executor.submit(self._fetch, doi): doi for doi in missing}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+    def fetch(self, doi: str) -> Dict[str, Any]:
+        """The article of one DOI; raises when it cannot be fetched"""
+        (_, article, error), = self.iter_articles([doi])
+        if error:
+            raise error
+        return article
+
+
+@st.cache_resource
+def get_article_fetcher() -> ArticleFetcher:
+    """The Crossref article fetcher shared by all reruns and sessions"""
+    return ArticleFetcher(
+        client=get_crossref_client(),
+        max_workers=int(st.secrets.get("CROSSREF_MAX_WORKERS", DEFAULT_MAX_WORKERS)),
+    )
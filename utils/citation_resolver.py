@@ -0,0 +1,241 @@
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+import requests
+from requests.adapters import HTTPAdapter
+import streamlit as st
+from utils.storage import SQLITE_LOOKUP_BATCH, data_path, open_sqlite
+
+DOI_RESOLVER_URL = "https://doi.org/"
+
+# content-negotiation media types of the citation formats, see
+# https://citation.crosscite.org/docs.html
+CITATION_FORMATS = {
+    "text": "text/x-bibliography",
+    "bibtex": "application/x-bibtex",
+    "ris": "application/x-research-info-systems",
+    "citeproc-json": "application/vnd.citationstyles.csl+json",
+}
+
+# citations fetched at the same time, and the request rate Crossref asks
+# polite clients to stay under; override with CROSSREF_MAX_WORKERS and
+# CROSSREF_REQUESTS_PER_SECOND in secrets
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_REQUESTS_PER_SECOND = 10
+
+# seconds to wait for the connection and for the citation
+CITATION_TIMEOUT = (5, 20)
+
+
+def normalize_doi(doi: str) -> str:
+    """The bare, lower-case DOI of a DOI or doi.org URL; DOIs are case-insensitive"""
+    doi = doi.strip()
+    doi = re.sub(r"^(https?://)?(dx\.)?doi\.org/", "", doi, flags=re.IGNORECASE)
+    doi = re.sub(r"^doi:\s*", "", doi, flags=re.IGNORECASE)
+    return doi.lower()
+
+
+class CitationCache:
+    """Persistent store of formatted citations keyed by (DOI, format, style)"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or data_path("citation_cache.sqlite3")
+        self._conn, self._lock = open_sqlite(
+            self.path,
+            "CREATE TABLE IF NOT EXISTS citations ("
+            "doi TEXT NOT NULL, "
+            "format TEXT NOT NULL, "
+            "style TEXT NOT NULL, "
+            "citation TEXT NOT NULL, "
+            "PRIMARY KEY (doi, format, style));"
+        )
+
+    def get_many(self, dois: List[str], format: str, style: str) -> Dict[str, str]:
+        """Return the cached citations of the given normalized DOIs that are present"""
+        found = {}
+        unique = list(dict.fromkeys(dois))
+        with self._lock:
+            for start in range(0, len(unique), SQLITE_LOOKUP_BATCH):
+                batch = unique[start:start + SQLITE_LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT doi, citation FROM citations "
+                    f"WHERE format = ? AND style = ? AND doi IN ({placeholders})",
+                    [format, style, *batch]
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def put_many(self, citations: Dict[str, str], format: str, style: str):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO citations (doi, format, style, citation) VALUES (?, ?, ?, ?)",
+                [(doi, format, style, citation) for doi, citation in citations.items()]
+            )
+            self._conn.commit()
+
+
+class PdfCitationCache:
+    """
+    Persistent store of the citation metadata extracted from PDFs.
+
+    Entries are keyed by the PDF's content hash, so a paper that anyone
+    uploads again gets its citation without another LLM call.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or data_path("citation_cache.sqlite3")
+        self._conn, self._lock = open_sqlite(
+            self.path,
+            "CREATE TABLE IF NOT EXISTS pdf_citations ("
+            "key TEXT PRIMARY KEY, "
+            "data TEXT NOT NULL);"
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM pdf_citations WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, citation_info: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pdf_citations (key, data) VALUES (?, ?)",
+                (key, json.dumps(citation_info))
+            )
+            self._conn.commit()
+
+
+class RateLimiter:
+    """Spaces out calls from any number of threads to at most `rate` per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class CrossrefClient:
+    """
+    The HTTP session and rate limit of every request to Crossref.
+
+    Citations come from doi.org and article metadata from the works API, but
+    both are served by Crossref, so they share one pooled session and one
+    request budget instead of each spending the whole polite rate.
+    """
+
+    def __init__(self, mailto: Optional[str] = None, max_workers: int = DEFAULT_MAX_WORKERS,
+                 requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND):
+        """
+        :param mailto: contact address sent to Crossref to use its polite pool
+        :param max_workers: requests each user of the client makes at the same time
+        :param requests_per_second: the maximum request rate of all users together
+        """
+        self.mailto = mailto
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.session = requests.Session()
+        # the citation resolver and the article fetcher each run max_workers requests
+        self.session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=2 * max_workers))
+        user_agent = "lit-review-assistant"
+        if mailto:
+            user_agent += f" (mailto:{mailto})"
+        self.session.headers["User-Agent"] = user_agent
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """A rate-limited GET through the shared session"""
+        self.rate_limiter.wait()
+        return self.session.get(url, **kwargs)
+
+
+@st.cache_resource
+def get_crossref_client() -> CrossrefClient:
+    """The Crossref client shared by the citation resolver and the article fetcher"""
+    return CrossrefClient(
+        mailto=st.secrets.get("crossref_mailto"),
+        max_workers=int(st.secrets.get("CROSSREF_MAX_WORKERS", DEFAULT_MAX_WORKERS)),
+        requests_per_second=float(st.secrets.get("CROSSREF_REQUESTS_PER_SECOND", DEFAULT_REQUESTS_PER_SECOND)),
+    )
+
+
+class CitationResolver:
+    """
+    Resolves many DOIs to formatted citations at once.
+
+    A DOI's citation never changes, so every citation fetched is kept in a
+    CitationCache on disk and served from there on later calls, across
+    restarts. The misses are fetched concurrently with DOI content
+    negotiation through the CrossrefClient, which keeps them polite.
+    """
+
+    def __init__(self, cache: Optional[CitationCache] = None, client: Optional[CrossrefClient] = None,
+                 max_workers: int = DEFAULT_MAX_WORKERS):
+        """
+        :param cache: the citation cache; defaults to one in the data directory
+        :param client: the Crossref client; defaults to one of its own
+        :param max_workers: citations fetched at the same time
+        """
+        self.cache = cache or CitationCache()
+        self.client = client or CrossrefClient(max_workers=max_workers)
+        self.max_workers = max_workers
+
+    def _fetch(self, doi: str, format: str, style: str) -> Optional[str]:
+        media_type = CITATION_FORMATS[format]
+        accept = f"{media_type}; style={style}" if format == "text" else media_type
+        try:
+            response = self.client.get(
+                DOI_RESOLVER_URL + doi,
+                headers={"Accept": accept},
+                timeout=CITATION_TIMEOUT
+            )
+            response.raise_for_status()
+        except requests.RequestException:
+            return None
+        response.encoding = "utf-8"
+        return response.text.strip() or None
+
+    def resolve(self, dois: Iterable[str], format: str = "text", style: str = "apa") -> Dict[str, Optional[str]]:
+        """
+        Get the citations of several DOIs.
+
+        :param dois: DOIs or doi.org URLs
+        :param format: requested format of the citations, eg. text, bibtex, ris
+        :param style: citation style of the text format, eg. apa
+        :return: the citation of each given DOI as passed in, None if it could not be fetched
+        """
+        if format not in CITATION_FORMATS:
+            raise ValueError(f"unsupported citation format: {format}")
+        dois = list(dois)
+        keys = {doi: normalize_doi(doi) for doi in dois}
+        citations = self.cache.get_many(list(keys.values()), format, style)
+
+        missing = [key for key in dict.fromkeys(keys.values()) if key not in citations]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+                fetched = dict(zip(missing, executor.map(lambda key: self._fetch(key, format, style), missing)))
+            # failures are not cached, so they are retried next time
+            fetched = {key: citation for key, citation in fetched.items() if citation}
+            if fetched:
+                self.cache.put_many(fetched, format, style)
+            citations.update(fetched)
+
+        return {doi: citations.get(key) for doi, key in keys.items()}
+
+
+@st.cache_resource
+def get_citation_resolver() -> CitationResolver:
+    """The citation resolver shared by all reruns and sessions"""
+    return CitationResolver(
+        client=get_crossref_client(),
+        max_workers=int(st.secrets.get("CROSSREF_MAX_WORKERS", DEFAULT_MAX_WORKERS)),
+    )
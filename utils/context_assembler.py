@@ -0,0 +1,158 @@
+"""
+Fits the research context of a chat turn into a per-model token budget.
+
+Each context item is tokenized once (counts are cached by text), then items
+are added by priority -- RAG hits, then pinned papers, then PDF abstracts --
+and by relevance to the question within each group. An item that no longer
+fits is truncated if a useful amount of budget is left, otherwise dropped,
+and the report records both so the user can see what the model did not get.
+"""
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import tiktoken
+
+# tokens available for research context, per OpenRouter model; the rest of
+# the window is left for the system prompt, chat history and the answer
+MODEL_CONTEXT_BUDGETS = {
+    'openai/gpt-4o': 48_000,
+    'anthropic/claude-3.5-sonnet': 64_000,
+    'google/gemini-flash-1.5': 64_000,
+}
+DEFAULT_CONTEXT_BUDGET = 16_000
+
+# an item is truncated rather than dropped only if this many tokens still fit
+MIN_TRUNCATED_TOKENS = 200
+
+# lower values are filled first
+PRIORITIES = {
+    'rag': 0,
+    'pinned': 1,
+    'abstract': 2,
+}
+
+_WORD = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    return tiktoken.get_encoding("cl100k_base")
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Number of tokens in a context item, cached by its text"""
+    return len(_get_encoding().encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = _get_encoding()
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def context_budget(model: str) -> int:
+    return MODEL_CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET)
+
+
+def relevance(text: str, query: str) -> float:
+    """Share of the query's words that appear in the text"""
+    query_words = set(_WORD.findall(query.lower()))
+    if not query_words:
+        return 0.0
+    return len(query_words & set(_WORD.findall(text.lower()))) / len(query_words)
+
+
+@dataclass
+class ContextItem:
+    text: str
+    kind: str
+    relevance: float = 0.0
+
+    @property
+    def label(self) -> str:
+        return self.text.split('\n', 1)[0].strip('* ')[:80]
+
+
+@dataclass
+class ContextReport:
+    """What went into the prompt and what was cut to respect the budget"""
+    budget: int
+    used_tokens: int = 0
+    included: List[str] = field(default_factory=list)
+    truncated: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+
+    @property
+    def complete(self) -> bool:
+        return not self.truncated and not self.dropped
+
+    def summary(self) -> str:
+        parts = [f"{self.used_tokens:,} of {self.budget:,} context tokens used"]
+        if self.truncated:
+            parts.append(f"{len(self.truncated)} item(s) truncated")
+        if self.dropped:
+            parts.append(f"{len(self.dropped)} item(s) left out")
+        return ", ".join(parts)
+
+
+def collect_context_items(
+        api_context: List[str],
+        rag_results: List[str],
+        rag_abstracts: List[str],
+        query: str,
+) -> List[ContextItem]:
+    """
+    Classify the session's context strings and score them against the question.
+
+    :param api_context: the full context strings sent to the model
+    :param rag_results: the RAG hits for the current question, best first
+    :param rag_abstracts: the abstracts of uploaded PDFs
+    :param query: the user's question
+    """
+    items = [
+        # keep the retriever's ranking for RAG hits
+        ContextItem(text, 'rag', 1.0 / (rank + 1))
+        for rank, text in enumerate(rag_results)
+    ]
+    seen = set(rag_results)
+    abstracts = set(rag_abstracts)
+    for text in api_context:
+        if text in seen:
+            continue
+        seen.add(text)
+        kind = 'abstract' if text in abstracts else 'pinned'
+        items.append(ContextItem(text, kind, relevance(text, query)))
+    return items
+
+
+def assemble_context(
+        items: List[ContextItem],
+        model: str,
+        budget: Optional[int] = None,
+) -> Tuple[List[str], ContextReport]:
+    """
+    Fill the model's context budget with the highest priority items.
+
+    :param items: the candidate context items
+    :param model: the OpenRouter model the prompt is sent to
+    :param budget: token budget; defaults to the model's budget
+    :return: the context strings to send, in priority order, and the report
+    """
+    report = ContextReport(budget=budget if budget is not None else context_budget(model))
+    selected = []
+    ordered = sorted(items, key=lambda item: (PRIORITIES.get(item.kind, len(PRIORITIES)), -item.relevance))
+    for item in ordered:
+        tokens = count_tokens(item.text)
+        remaining = report.budget - report.used_tokens
+        if tokens <= remaining:
+            selected.append(item.text)
+            report.used_tokens += tokens
+            report.included.append(item.label)
+        elif remaining >= MIN_TRUNCATED_TOKENS:
+            selected.append(truncate_to_tokens(item.text, remaining) + " [truncated]")
+            report.used_tokens = report.budget
+            report.truncated.append(item.label)
+        else:
+            report.dropped.append(item.label)
+    return selected, report
@@ -1,5 +1,40 @@
+import queue
+import threading
+import time
 import streamlit as st
-from utils.doi import get_article_with_doi
+from utils.article_fetcher import get_article_fetcher
+from utils.citation_resolver import normalize_doi
+from utils.embedding_cache import CachedEmbeddingFunction
+from utils.embedding_writer import EmbeddingWriter
+from utils.lexical_index import LexicalIndex
+from utils.facet_index import FacetIndex
+from utils.query_cache import get_query_cache
+
+# the library's ChromaDB directory and the phrase and facet indexes kept next to it
+LIBRARY_DIR = "library"
+LIBRARY_INDEX_PATH = "library_lexical.sqlite3"
+LIBRARY_FACETS_PATH = "library_facets.npz"
+
+# year/journal filters matching at most this many abstracts are sent to ChromaDB
+# as an ID allow-list; broader filters are cheaper as a metadata filter
+MAX_ALLOW_LIST = 20000
+
+# abstracts read from the library at a time while the phrase index is built
+INDEX_BUILD_BATCH_SIZE = 5000
+
+# articles fetched from Crossref are written to the library this many at a
+# time, after waiting this many seconds for more to arrive
+LIBRARY_WRITE_BATCH_SIZE = 64
+LIBRARY_WRITE_LINGER = 2.0
+
+# seconds the writer waits for the library indexes to be built; after that,
+# or once the build has failed, articles are written without updating them
+LIBRARY_INDEX_WAIT = 600
+
+# seconds between saves of the facet index while articles keep arriving; it is
+# also saved once the writer is idle. A save that was missed only costs a
+# rebuild from the library metadata on the next start
+LIBRARY_FACETS_SAVE_INTERVAL = 60.0
 
 # SQLite module replacement for ChromaDB compatibility
 try:
@@ -15,11 +50,15 @@ try:
     from chromadb.utils import embedding_functions
     CHROMADB_AVAILABLE = True
     
-    # Initialize OpenAI embedding function
+    # Initialize OpenAI embedding function, behind a persistent embedding cache
+    # so that chunks embedded before are never sent to the API again
     try:
-        openai_ef = embedding_functions.OpenAIEmbeddingFunction(
+        openai_ef = CachedEmbeddingFunction(
+            embedding_functions.OpenAIEmbeddingFunction(
+                model_name="text-embedding-ada-002",
+                api_key=st.secrets["OPENAI_API_KEY"],
+            ),
             model_name="text-embedding-ada-002",
-            api_key=st.secrets["OPENAI_API_KEY"],
         )
     except Exception as e:
         st.warning(f"Could not initialize OpenAI embedding function: {e}")
@@ -43,7 +82,7 @@ def get_document_collection():
         return None
         
     try:
-        api = chromadb.PersistentClient(path="library")
+        api = chromadb.PersistentClient(path=LIBRARY_DIR)
         collection = api.get_or_create_collection("langchain", embedding_function=openai_ef)
         st.success("✅ Document search collection initialized successfully")
         return collection
@@ -62,6 +101,271 @@ def get_document_collection():
 collection = get_document_collection()
 
 
+@st.cache_resource
+def get_library_index() -> LexicalIndex:
+    """Positional index over the library abstracts, used for exact-phrase filters"""
+    return LexicalIndex(LIBRARY_INDEX_PATH)
+
+
+# the year/journal facet index, once built
+_library_facets = {}
+
+# set when the library indexes could not be built
+_library_index_failed = threading.Event()
+
+
+def _year(value) -> int:
+    """The publication year of a metadata value, 0 when it is not a year"""
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _load_facets(total: int):
+    try:
+        facets = FacetIndex.load(LIBRARY_FACETS_PATH)
+    except (OSError, ValueError, KeyError):
+        return None
+    return facets if len(facets) == total else None
+
+
+def _build_library_index(index: LexicalIndex, ready: threading.Event):
+    try:
+        total = collection.count()
+        rebuild_text = total != index.count()
+        facets = _load_facets(total)
+        if rebuild_text:
+            index.clear()
+
+        if rebuild_text or facets is None:
+            ids, journals, years = [], [], []
+            include = ['metadatas', 'documents'] if rebuild_text else ['metadatas']
+            for offset in range(0, total, INDEX_BUILD_BATCH_SIZE):
+                batch = collection.get(include=include, limit=INDEX_BUILD_BATCH_SIZE, offset=offset)
+                if rebuild_text:
+                    index.add(batch['ids'], batch['documents'])
+                ids += batch['ids']
+                journals += [str(metadata.get('journal', '')) for metadata in batch['metadatas']]
+                years += [_year(metadata.get('year')) for metadata in batch['metadatas']]
+            if facets is None:
+                facets = FacetIndex(ids, journals, years)
+                facets.save(LIBRARY_FACETS_PATH)
+
+        _library_facets['index'] = facets
+        ready.set()
+    except Exception as e:
+        _library_index_failed.set()
+        print(f"Could not build the library indexes: {e}")
+
+
+@st.cache_resource
+def start_library_index() -> threading.Event:
+    """
+    Bring the library phrase and facet indexes up to date in the background.
+
+    :return: an event that is set once the index covers the whole library
+    """
+    ready = threading.Event()
+    if collection:
+        threading.Thread(
+            target=_build_library_index,
+            args=(get_library_index(), ready),
+            name="library-index",
+            daemon=True
+        ).start()
+    return ready
+
+
+def phrase_candidates(contains: list[str] = None, condition: str = None, author: str = None):
+    """
+    IDs of the library abstracts that satisfy the exact-phrase and author filters.
+
+    :return: the matching IDs, or None when there is nothing to filter or the
+        index is still being built and the filters must be applied by ChromaDB
+    """
+    if not contains and not author:
+        return None
+    if not start_library_index().is_set():
+        return None
+
+    index = get_library_index()
+    ids = index.match(contains, condition or "AND") if contains else None
+    if author:
+        author_ids = index.phrase_ids(author)
+        ids = author_ids if ids is None else ids & author_ids
+    return ids
+
+
+def get_library_facets():
+    """The year/journal facet index, or None while it is being built"""
+    if not start_library_index().is_set():
+        return None
+    return _library_facets.get('index')
+
+
+def library_facet_counts(year_range: list[int] = None):
+    """Number of library abstracts per journal within the year range, or None while the index is built"""
+    facets = get_library_facets()
+    if facets is None:
+        return None
+    return facets.journal_counts(year_range)
+
+
+class LibraryWriter:
+    """
+    Writes the articles fetched from Crossref into the library in the background.
+
+    Articles are queued by find_docs and written in batches by one thread, so
+    the search never waits on embedding. Each DOI is written once: DOIs that
+    are queued or already in the library are skipped. Written articles are
+    added to the phrase and facet indexes and the library's cached search
+    results are invalidated, so the next search for them is served locally.
+    When the indexes are not available, articles are still written and the
+    indexes catch up when they are next rebuilt.
+    """
+
+    def __init__(self, library, index: LexicalIndex, index_ready: threading.Event, query_cache):
+        """
+        :param library: the library collection
+        :param index: the library phrase index
+        :param index_ready: set once the phrase and facet indexes are built
+        :param query_cache: the process-wide query cache
+        """
+        self.library = library
+        self.index = index
+        self.index_ready = index_ready
+        self.query_cache = query_cache
+        self.embedding_writer = EmbeddingWriter(openai_ef)
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        # when the facet index was last saved, and whether it changed since
+        self._facets_saved = time.monotonic()
+        self._facets_dirty = False
+        threading.Thread(target=self._run, name="library-writer", daemon=True).start()
+
+    def submit(self, articles: list):
+        """Queue articles for the library, ignoring DOIs that are already queued"""
+        with self._lock:
+            for article in articles:
+                key = normalize_doi(article['doi'])
+                if key not in self._queued:
+                    self._queued.add(key)
+                    self._queue.put(article)
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=LIBRARY_FACETS_SAVE_INTERVAL if self._facets_dirty else None)]
+            except queue.Empty:
+                self._save_facets()
+                continue
+            deadline = time.monotonic() + LIBRARY_WRITE_LINGER
+            while len(batch) < LIBRARY_WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"Could not add fetched articles to the library: {e}")
+            finally:
+                with self._lock:
+                    self._queued.difference_update(normalize_doi(article['doi']) for article in batch)
+
+    def _indexes_ready(self) -> bool:
+        """Wait for the indexes to cover the library, unless their build failed"""
+        deadline = time.monotonic() + LIBRARY_INDEX_WAIT
+        while not self.index_ready.wait(timeout=LIBRARY_WRITE_LINGER):
+            if _library_index_failed.is_set() or time.monotonic() > deadline:
+                return False
+        return True
+
+    def _write(self, articles: list):
+        # the indexes must cover the library before new records are added to them
+        indexes_ready = self._indexes_ready()
+
+        variants = [variant for article in articles for variant in _doi_variants(article['doi'])]
+        stored = self.library.get(where={"doi": {"$in": variants}}, include=['metadatas'])
+        known = {normalize_doi(metadata['doi']) for metadata in stored['metadatas']}
+        articles = [article for article in articles if normalize_doi(article['doi']) not in known]
+        if not articles:
+            return
+
+        metadatas = [
+            {
+                'title': article['title'],
+                'journal': article['journal'],
+                'year': _year(article['year']),
+                'authors': article['authors'],
+                'doi': article['doi'],
+                'cite_counts': article['cite_counts'],
+            }
+            for article in articles
+        ]
+        documents = [library_document(article) for article in articles]
+        result = self.embedding_writer.write(
+            self.library,
+            [article['id'] for article in articles],
+            documents,
+            metadatas
+        )
+        written = set(result.written_ids)
+        if not written:
+            return
+
+        self.query_cache.invalidate('library')
+        if not indexes_ready:
+            return
+
+        positions = [position for position, article in enumerate(articles) if article['id'] in written]
+        self.index.add(
+            [articles[position]['id'] for position in positions],
+            [documents[position] for position in positions]
+        )
+        facets = _library_facets.get('index')
+        if facets is not None:
+            facets.add(
+                [articles[position]['id'] for position in positions],
+                [metadatas[position]['journal'] for position in positions],
+                [metadatas[position]['year'] for position in positions]
+            )
+            self._facets_dirty = True
+            if time.monotonic() - self._facets_saved >= LIBRARY_FACETS_SAVE_INTERVAL:
+                self._save_facets()
+        # results cached while the indexes were updated are stale too
+        self.query_cache.invalidate('library')
+
+    def _save_facets(self):
+        facets = _library_facets.get('index')
+        if facets is None or not self._facets_dirty:
+            return
+        try:
+            facets.save(LIBRARY_FACETS_PATH)
+            self._facets_dirty = False
+        except Exception as e:
+            print(f"Could not save the library facet index: {e}")
+        self._facets_saved = time.monotonic()
+
+
+@st.cache_resource
+def get_library_writer() -> LibraryWriter:
+    """The background writer of fetched articles into the library"""
+    return LibraryWriter(collection, get_library_index(), start_library_index(), get_query_cache())
+
+
+def library_document(article: dict) -> str:
+    """
+    The text an article is stored under in the library.
+
+    Library documents carry the author names after the abstract, which the
+    author filter searches and found_articles_in_format strips back out.
+    """
+    return f"{article['text']}\n{article['authors']}"
+
+
 def found_articles_in_format(docs: dict) -> list:
     results = []
     for i in range(len(docs['ids'][0])):
@@ -81,6 +385,123 @@ def found_articles_in_format(docs: dict) -> list:
     return results
 
 
+def _search_library(
+        topic: str,
+        year_range: list[int],
+        journal: list[dict],
+        contains: list[str],
+        condition: str,
+        author: str,
+        number_of_docs: int,
+) -> list:
+    """Run a topic search with filters against the library collection"""
+    # always enforce year range
+    year_cond = {"$and": [
+        {"year": {"$gte": year_range[0]}},
+        {"year": {"$lte": year_range[1]}}
+    ]}
+
+    # if no journal, just use year
+    if not journal:
+        where = year_cond
+
+    # for only one journal
+    elif len(journal) == 1:
+        where = {"$and": [
+            journal[0],
+            year_cond
+        ]
+        }
+
+    # for multiple journals
+    else:
+        where = {"$and": [
+            {"$or": journal,
+             },
+            year_cond
+        ]
+        }
+
+    # author search
+    if author:
+        author_cond = {"$contains": author}
+
+    # if no contains, just use None
+    where_document = None
+
+    # if not contains
+    if not contains and author:
+        where_document = author_cond
+
+    # for only one criterion for contains
+    if contains and len(contains) == 1:
+        where_document = {"$contains": contains[0]}
+        if author:
+            where_document = {"$and": [where_document, author_cond]}
+
+    # for multiple criteria for contains
+    elif contains:
+        contains_items = []
+        for item in contains:
+            contains_items.append({"$contains": item})
+        if condition == "AND":
+            where_document = {"$and": contains_items}
+            if author:
+                where_document["$and"].append(author_cond)
+        elif condition == "OR":
+            where_document = {"$or": contains_items}
+            if author:
+                where_document = {"$and": [where_document, author_cond]}
+        elif not condition:
+            where_document = {"$and": contains_items}
+            if author:
+                where_document["$and"].append(author_cond)
+
+    # resolve the phrase filters from the index instead of scanning every abstract;
+    # phrases too common for an ID allow-list stay a where_document filter
+    candidate_ids = phrase_candidates(contains, condition, author)
+    if candidate_ids is not None and len(candidate_ids) > MAX_ALLOW_LIST:
+        candidate_ids = None
+
+    # resolve the year and journal filters into an ID allow-list
+    facets = get_library_facets()
+    if facets is not None:
+        journal_names = [item['journal'] for item in journal] if journal else None
+        if candidate_ids is not None or facets.count(year_range, journal_names) <= MAX_ALLOW_LIST:
+            allowed_ids = facets.allowed_ids(year_range, journal_names, within=candidate_ids)
+            if not allowed_ids:
+                return []
+            docs = collection.query(
+                query_texts=topic,
+                ids=allowed_ids,
+                where_document=where_document if candidate_ids is None else None,
+                n_results=number_of_docs,
+            )
+            return found_articles_in_format(docs)
+
+    if candidate_ids is not None:
+        if not candidate_ids:
+            return []
+        docs = collection.query(
+            query_texts=topic,
+            where=where,
+            ids=list(candidate_ids),
+            n_results=number_of_docs,
+        )
+        return found_articles_in_format(docs)
+
+    # query the database
+    docs = collection.query(
+        query_texts=topic,
+        where=where,
+        where_document=where_document,
+        n_results=number_of_docs,
+    )
+
+    # return the results in the desired format
+    return found_articles_in_format(docs)
+
+
 #@st.cache_data(show_spinner=False)
 def find_docs(
         topic: str,
@@ -110,104 +531,75 @@ def find_docs(
         return []
         
     if not doi:
-        # always enforce year range
-        year_cond = {"$and": [
-            {"year": {"$gte": year_range[0]}},
-            {"year": {"$lte": year_range[1]}}
-        ]}
-
-        # if no journal, just use year
-        if not journal:
-            where = year_cond
-
-        # for only one journal
-        elif len(journal) == 1:
-            where = {"$and": [
-                journal[0],
-                year_cond
-            ]
-            }
+        # identical searches from any session are served from the query cache;
+        # the library's record count versions the cached results
+        filters = {
+            'year_range': year_range,
+            'journal': journal,
+            'contains': contains,
+            'condition': condition,
+            'author': author,
+            'number_of_docs': number_of_docs,
+        }
+        query_cache = get_query_cache()
+        version = collection.count()
+        results = query_cache.get('library', topic, filters, version=version)
+        if results is None:
+            results = _search_library(topic, year_range, journal, contains, condition, author, number_of_docs)
+            query_cache.put('library', topic, filters, results, version=version)
+        return results
 
-        # for multiple journals
+    else:
+        if '\n' in st.session_state.doi_search:
+            doi = doi.split('\n')
+
+            # ensure duplicates are removed
+            doi = list(dict.fromkeys(item.strip() for item in doi if item.strip()))
         else:
-            where = {"$and": [
-                {"$or": journal,
-                 },
-                year_cond
-            ]
-            }
+            doi = [doi]
 
-        # author search
-        if author:
-            author_cond = {"$contains": author}
+        return _find_dois(doi)
 
-        # if no contains, just use None
-        where_document = None
 
-        # if not contains
-        if not contains and author:
-            where_document = author_cond
+def _doi_variants(doi: str) -> list:
+    """The spellings a DOI may be stored under in the library"""
+    bare = normalize_doi(doi)
+    # DOIs are case-insensitive but stored with the publisher's capitalization
+    spellings = [bare, doi[len(doi) - len(bare):]] if doi.lower().endswith(bare) else [bare]
+    return list(dict.fromkeys(
+        [doi] + [f"{prefix}{spelling}" for spelling in spellings for prefix in ("", "https://doi.org/", "http://dx.doi.org/")]
+    ))
 
-        # for only one criterion for contains
-        if contains and len(contains) == 1:
-            where_document = {"$contains": contains[0]}
-            if author:
-                where_document = {"$and": [where_document, author_cond]}
 
-        # for multiple criteria for contains
-        elif contains:
-            contains_items = []
-            for item in contains:
-                contains_items.append({"$contains": item})
-            if condition == "AND":
-                where_document = {"$and": contains_items}
-                if author:
-                    where_document["$and"].append(author_cond)
-            elif condition == "OR":
-                where_document = {"$or": contains_items}
-                if author:
-                    where_document = {"$and": [where_document, author_cond]}
-            elif not condition:
-                where_document = {"$and": contains_items}
-                if author:
-                    where_document["$and"].append(author_cond)
-
-        # query the database
-        docs = collection.query(
-            query_texts=topic,
-            where=where,
-            where_document=where_document,
-            n_results=number_of_docs,
-        )
+def _find_dois(dois: list) -> list:
+    """
+    The articles of a list of DOIs, from the library or else from Crossref.
 
-        # return the results in the desired format
-        return found_articles_in_format(docs)
+    The DOIs missing from the library are fetched concurrently; the progress is
+    shown as they arrive and DOIs that cannot be fetched are reported without
+    losing the others.
+    """
+    variants = [variant for doi in dois for variant in _doi_variants(doi)]
+    stored = collection.get(where={"doi": {"$in": variants}}, include=['documents', 'metadatas'])
+    found = found_articles_in_format({key: [stored[key]] for key in ('ids', 'documents', 'metadatas')})
+    found_dois = {normalize_doi(article['doi']) for article in found}
 
-    else:
-        if '\n' in st.session_state.doi_search:
-            doi = doi.split('\n')
+    missing = [doi for doi in dois if normalize_doi(doi) not in found_dois]
+    if not missing:
+        return found
 
-            # ensure duplicates are removed
-            doi = list(set([item.strip() for item in doi]))
+    fetched = {}
+    progress = st.progress(0.0, text=f"Fetching {len(missing)} articles from Crossref...")
+    for done, (doi, article, error) in enumerate(get_article_fetcher().iter_articles(missing), start=1):
+        if article:
+            fetched[doi] = article
         else:
-            doi = [doi]
-
-        where = {"doi": {"$in": doi}}
-        topic = ' '
+            st.toast(error)
+        progress.progress(done / len(missing), text=f"Fetched {done} of {len(missing)} articles")
+    progress.empty()
 
-        # query the database
-        docs = collection.query(
-            query_texts=topic,
-            where=where
-        )
+    # warm the library with what was asked for, so the next lookup is local
+    if fetched and openai_ef:
+        get_library_writer().submit(list(fetched.values()))
 
-        if len(docs['documents'][0]) == 0:
-            docs = []
-            for d in doi:
-                try:
-                    docs.append(get_article_with_doi(d))
-                except Exception as e:
-                    st.toast(e)
-            return docs
-        else:
-            return found_articles_in_format(docs)
+    return found + [fetched[doi] for doi in missing if doi in fetched]
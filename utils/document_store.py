@@ -0,0 +1,198 @@
+import json
+import time
+from typing import Any, Dict, List, Optional
+from utils.storage import SQLITE_LOOKUP_BATCH, open_sqlite
+
+
+class DocumentStore:
+    """
+    Per-document metadata kept in SQLite next to the ChromaDB collection.
+
+    One row per ingested PDF, written when the document is complete and removed
+    with its chunks, so listing, counting and looking up documents never reads
+    chunk rows from the vector store. The store also records the IDs of each
+    document's chunks, so a document is deleted without searching for them,
+    and the owners (sessions) that uploaded it, so one owner's documents are
+    cleared without touching anyone else's.
+    """
+
+    # columns that documents can be looked up by
+    LOOKUP_FIELDS = ('file_hash', 'fingerprint', 'doi')
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn, self._lock = open_sqlite(
+            self.path,
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id TEXT PRIMARY KEY, "
+            "file_hash TEXT, "
+            "fingerprint TEXT, "
+            "doi TEXT, "
+            "upload_time REAL, "
+            "data TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS documents_file_hash ON documents (file_hash);"
+            "CREATE INDEX IF NOT EXISTS documents_fingerprint ON documents (fingerprint);"
+            "CREATE INDEX IF NOT EXISTS documents_doi ON documents (doi);"
+            "CREATE TABLE IF NOT EXISTS document_chunks ("
+            "chunk_id TEXT PRIMARY KEY, "
+            "doc_id TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS document_chunks_doc_id ON document_chunks (doc_id);"
+            "CREATE TABLE IF NOT EXISTS document_owners ("
+            "doc_id TEXT NOT NULL, "
+            "owner TEXT NOT NULL, "
+            "claimed_at REAL NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (doc_id, owner));"
+            "CREATE INDEX IF NOT EXISTS document_owners_owner ON document_owners (owner);"
+        )
+        # stores created before claims were timed
+        with self._lock:
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(document_owners)")}
+            if 'claimed_at' not in columns:
+                self._conn.execute("ALTER TABLE document_owners ADD COLUMN claimed_at REAL NOT NULL DEFAULT 0")
+                self._conn.commit()
+
+    def upsert(self, document: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (id, file_hash, fingerprint, doi, upload_time, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    document['id'],
+                    document.get('file_hash'),
+                    document.get('fingerprint'),
+                    str(document.get('doi', '')),
+                    document.get('upload_time', 0),
+                    json.dumps(document),
+                )
+            )
+            self._conn.commit()
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(self, field: str, value: Any) -> Optional[Dict[str, Any]]:
+        """Return the first document whose lookup field has the given value"""
+        if field not in self.LOOKUP_FIELDS:
+            raise ValueError(f"documents cannot be looked up by {field}")
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT data FROM documents WHERE {field} = ? LIMIT 1", (value,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list(self, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        """All documents, or those of one owner, oldest upload first"""
+        with self._lock:
+            if owner is None:
+                rows = self._conn.execute("SELECT data FROM documents ORDER BY upload_time").fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT d.data FROM documents d JOIN document_owners o ON o.doc_id = d.id "
+                    "WHERE o.owner = ? ORDER BY d.upload_time",
+                    (owner,)
+                ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def remove(self, doc_id: str) -> bool:
+        """Forget a document, its chunk IDs and its owners"""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,)).rowcount
+            self._conn.execute("DELETE FROM document_chunks WHERE doc_id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM document_owners WHERE doc_id = ?", (doc_id,))
+            self._conn.commit()
+        return removed > 0
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.execute("DELETE FROM document_chunks")
+            self._conn.execute("DELETE FROM document_owners")
+            self._conn.commit()
+
+    def add_chunks(self, doc_id: str, chunk_ids: List[str]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO document_chunks (chunk_id, doc_id) VALUES (?, ?)",
+                [(chunk_id, doc_id) for chunk_id in chunk_ids]
+            )
+            self._conn.commit()
+
+    def chunk_ids(self, doc_id: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_id FROM document_chunks WHERE doc_id = ?", (doc_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def remove_chunks(self, chunk_ids: List[str]):
+        with self._lock:
+            for start in range(0, len(chunk_ids), SQLITE_LOOKUP_BATCH):
+                batch = chunk_ids[start:start + SQLITE_LOOKUP_BATCH]
+                self._conn.execute(
+                    f"DELETE FROM document_chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch
+                )
+            self._conn.commit()
+
+    def unfinished_documents(self) -> List[str]:
+        """IDs of documents that have chunk rows but were never completed"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT c.doc_id FROM document_chunks c "
+                "LEFT JOIN documents d ON d.id = c.doc_id WHERE d.id IS NULL"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def add_owner(self, doc_id: str, owner: str):
+        """Record an owner of a document, or renew the time of an existing claim"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO document_owners (doc_id, owner, claimed_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (doc_id, owner) DO UPDATE SET claimed_at = excluded.claimed_at",
+                (doc_id, owner, time.time())
+            )
+            self._conn.commit()
+
+    def remove_owner(self, doc_id: str, owner: str) -> int:
+        """Detach an owner from a document and return how many owners it has left"""
+        with self._lock:
+            self._conn.execute("DELETE FROM document_owners WHERE doc_id = ? AND owner = ?", (doc_id, owner))
+            self._conn.commit()
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM document_owners WHERE doc_id = ?", (doc_id,)
+            ).fetchone()[0]
+
+    def expire_owners(self, prefix: str, claimed_before: float) -> List[str]:
+        """
+        Drop the claims of owners with the given prefix made before a time.
+
+        :return: IDs of the documents that have no owner left because of it
+        """
+        with self._lock:
+            expired = self._conn.execute(
+                "SELECT DISTINCT doc_id FROM document_owners WHERE owner LIKE ? || '%' AND claimed_at < ?",
+                (prefix, claimed_before)
+            ).fetchall()
+            self._conn.execute(
+                "DELETE FROM document_owners WHERE owner LIKE ? || '%' AND claimed_at < ?",
+                (prefix, claimed_before)
+            )
+            self._conn.commit()
+            orphans = []
+            for (doc_id,) in expired:
+                if not self._conn.execute("SELECT 1 FROM document_owners WHERE doc_id = ?", (doc_id,)).fetchone():
+                    orphans.append(doc_id)
+        return orphans
+
+    def owned_documents(self, owner: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_id FROM document_owners WHERE owner = ?", (owner,)).fetchall()
+        return [row[0] for row in rows]
+
+    def vacuum(self):
+        """Reclaim the space of deleted rows"""
+        with self._lock:
+            self._conn.execute("VACUUM")
@@ -7,9 +7,10 @@ from bs4 import BeautifulSoup
 from tqdm import tqdm
 import requests
 from undetected_chromedriver import Chrome, ChromeOptions
+from utils.citation_resolver import CITATION_FORMATS, get_citation_resolver
+from utils.article_fetcher import get_article_fetcher
 
 
-@st.cache_data(show_spinner=False)
 def get_citation(
         doi: Union[List[str], str],
         format: str = "text",
@@ -21,15 +22,42 @@ def get_citation(
     :param format: requested format of the citation, eg. text, bibtex, ris, etc.
     :param style: citation style, eg. apa, chicago-fullnote-bibliography, etc.
     :return: citation in the requested format as a string or list of strings
+        (None for the dois of a list that could not be resolved)
     """
-    cr = Crossref(mailto=st.secrets["crossref_mailto"])
-    return cn.content_negotiation(ids=doi, format=format, style=style)
+    if format not in CITATION_FORMATS:
+        return cn.content_negotiation(ids=doi, format=format, style=style)
+
+    dois = [doi] if isinstance(doi, str) else list(doi)
+    citations = get_citation_resolver().resolve(dois, format=format, style=style)
+    if isinstance(doi, str):
+        if citations[doi] is None:
+            raise Exception(f'Could not get the citation of {doi}')
+        return citations[doi]
+    return [citations[item] for item in dois]
 
 
 def get_apa_citation(article: dict):
     st.session_state.citations[article['id']] = get_citation(article['doi'])
 
 
+def get_apa_citations(articles: List[dict]):
+    """
+    Resolve the APA citations of the articles that are not cited yet in one batch
+    :param articles: articles with an 'id' and a 'doi'
+    :return: None; citations that could not be resolved are left out of the session state
+    """
+    missing = [
+        article for article in articles
+        if article.get('doi') and article['id'] not in st.session_state.citations
+    ]
+    if not missing:
+        return
+    citations = get_citation_resolver().resolve([article['doi'] for article in missing])
+    for article in missing:
+        if citations[article['doi']]:
+            st.session_state.citations[article['id']] = citations[article['doi']]
+
+
 def get_journal_issn(
         article_doi: list,
         limit: int = 20
@@ -57,30 +85,7 @@ def get_journal_details(issn: list, limit: int = 20):
 
 
 def get_article_with_doi(doi: str) -> dict:
-    cr = Crossref(mailto=st.secrets["crossref_mailto"])
-
-    try:
-        docs = cr.works(doi)
-        soup = BeautifulSoup(docs['message']['abstract'], features="lxml").text
-        authors_dict = docs['message']['author']
-        family_names = []
-        for item in range(len(authors_dict)):
-            family_names.append(authors_dict[item]['family'])
-        article_info = {
-            'text': soup.strip(),
-            'year': str(docs['message']['published']['date-parts'][0][0]).strip(),
-            'cite_counts': '',
-            'title': docs['message']['title'][0].strip(),
-            'journal': docs['message']['container-title'][0].strip(),
-            'doi': docs['message']['URL'].strip(),
-            'id': doi.replace('https://doi.org/', '').replace('/', '-').strip(),
-            'authors': ', '.join(family_names),
-            # 'relevance': round((1 - round(docs['distances'][0][i], 2)) * 100),
-            'type': 'abstract'
-        }
-        return article_info
-    except Exception:
-        raise Exception(f'Could not get {doi}: Please ensure the doi is correct. if the error persists try uploading the PDF.')
+    return get_article_fetcher().fetch(doi)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,92 @@
+import hashlib
+from typing import Dict, List, Optional
+import numpy as np
+from utils.storage import SQLITE_LOOKUP_BATCH, data_path, open_sqlite
+
+
+class EmbeddingCache:
+    """Persistent store of embeddings keyed by (model name, SHA-256 of the text)"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or data_path("embedding_cache.sqlite3")
+        self._conn, self._lock = open_sqlite(
+            self.path,
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, "
+            "text_hash TEXT NOT NULL, "
+            "vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, text_hash));"
+        )
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Return the cached vectors for the given text hashes that are present"""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            for start in range(0, len(unique), SQLITE_LOOKUP_BATCH):
+                batch = unique[start:start + SQLITE_LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for text_hash, vector in rows:
+                    found[text_hash] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]):
+        """Store vectors keyed by text hash"""
+        rows = [
+            (model, text_hash, np.asarray(vector, dtype=np.float32).tobytes())
+            for text_hash, vector in vectors.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+
+class CachedEmbeddingFunction:
+    """
+    ChromaDB embedding function that serves known texts from an EmbeddingCache
+    and only sends cache misses to the wrapped embedding function.
+    """
+
+    def __init__(self, embedding_function, model_name: str, cache: Optional[EmbeddingCache] = None):
+        self._embedding_function = embedding_function
+        self.model_name = model_name
+        self.cache = cache or EmbeddingCache()
+
+    def __call__(self, input: List[str]) -> List[np.ndarray]:
+        hashes = [EmbeddingCache.text_hash(text) for text in input]
+        cached = self.cache.get_many(self.model_name, hashes)
+
+        # embed each distinct missing text once
+        missing = {}
+        for text, text_hash in zip(input, hashes):
+            if text_hash not in cached and text_hash not in missing:
+                missing[text_hash] = text
+
+        if missing:
+            vectors = self._embedding_function(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, fresh)
+            cached.update({key: np.asarray(value, dtype=np.float32) for key, value in fresh.items()})
+
+        return [cached[text_hash] for text_hash in hashes]
+
+    def embed_query(self, input: List[str]) -> List[np.ndarray]:
+        return self(input)
+
+    def __getattr__(self, name):
+        # expose name(), get_config() etc. of the wrapped function to ChromaDB
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._embedding_function, name)
@@ -0,0 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import tiktoken
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+
+def _is_transient_error(error: BaseException) -> bool:
+    """Rate limits, server errors and dropped connections are worth retrying"""
+    status_code = getattr(error, 'status_code', None)
+    if status_code is None:
+        status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    name = type(error).__name__
+    return name in ('RateLimitError', 'APIConnectionError', 'APITimeoutError', 'Timeout', 'ConnectionError')
+
+
+@dataclass
+class WriteResult:
+    """Outcome of an EmbeddingWriter.write call"""
+    written_ids: List[str] = field(default_factory=list)
+    skipped_ids: List[str] = field(default_factory=list)
+    failed_ids: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def complete(self) -> bool:
+        return not self.failed_ids
+
+
+class EmbeddingWriter:
+    """
+    Embeds chunks and writes them to a ChromaDB collection in batches.
+
+    Batches are sized by a token budget so that no request exceeds the
+    embedding API's per-request limit, several batches are embedded at the
+    same time, and each batch backs off on its own when rate limited. Every
+    batch is committed as soon as it is embedded; records that already exist
+    in the collection are skipped, so a retry resumes where the last attempt
+    stopped instead of re-embedding the whole document.
+    """
+
+    def __init__(
+            self,
+            embedding_function,
+            max_batch_tokens: int = 100_000,
+            max_batch_size: int = 512,
+            max_concurrent_batches: int = 4,
+            max_attempts: int = 6,
+    ):
+        """
+        :param embedding_function: ChromaDB embedding function used to embed the documents
+        :param max_batch_tokens: maximum number of tokens sent in one embedding request
+        :param max_batch_size: maximum number of documents sent in one embedding request
+        :param max_concurrent_batches: number of batches embedded at the same time
+        :param max_attempts: attempts per batch before it is reported as failed
+        """
+        self.embedding_function = embedding_function
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrent_batches = max_concurrent_batches
+        self._embed = retry(
+            retry=retry_if_exception(_is_transient_error),
+            wait=wait_random_exponential(multiplier=1, max=60),
+            stop=stop_after_attempt(max_attempts),
+            reraise=True,
+        )(lambda texts: self.embedding_function(texts))
+        try:
+            self._encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            self._encoding = None
+
+    def count_tokens(self, text: str) -> int:
+        if self._encoding is None:
+            return len(text) // 4 + 1
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def make_batches(self, documents: List[str]) -> List[List[int]]:
+        """Group document positions into batches that respect the token and size limits"""
+        batches = []
+        current = []
+        current_tokens = 0
+        for position, document in enumerate(documents):
+            tokens = self.count_tokens(document)
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(position)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def write(
+            self,
+            collection,
+            ids: List[str],
+            documents: List[str],
+            metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> WriteResult:
+        """
+        Embed and upsert records into the collection.
+
+        :param collection: the ChromaDB collection to write to
+        :param ids: record IDs
+        :param documents: record texts, embedded with the writer's embedding function
+        :param metadatas: record metadata
+        :return: which records were written, skipped as already present, or failed
+        """
+        result = WriteResult()
+        if not ids:
+            return result
+
+        # resume: records committed by an earlier attempt are not embedded again
+        existing = set(collection.get(ids=list(ids), include=[])['ids'])
+        pending = [position for position, record_id in enumerate(ids) if record_id not in existing]
+        result.skipped_ids = [record_id for record_id in ids if record_id in existing]
+
+        batches = [
+            [pending[index] for index in batch]
+            for batch in self.make_batches([documents[position] for position in pending])
+        ]
+
+        def write_batch(batch: List[int]) -> List[str]:
+            batch_ids = [ids[position] for position in batch]
+            batch_documents = [documents[position] for position in batch]
+            embeddings = self._embed(batch_documents)
+            collection.upsert(
+                ids=batch_ids,
+                embeddings=embeddings,
+                documents=batch_documents,
+                metadatas=[metadatas[position] for position in batch] if metadatas else None,
+            )
+            return batch_ids
+
+        workers = max(1, min(self.max_concurrent_batches, len(batches)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(batch, pool.submit(write_batch, batch)) for batch in batches]
+            for batch, future in futures:
+                try:
+                    result.written_ids += future.result()
+                except Exception as e:
+                    result.failed_ids += [ids[position] for position in batch]
+                    result.errors.append(str(e))
+
+        return result
@@ -0,0 +1,145 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+
+
+class FacetIndex:
+    """
+    Maps every (journal, year) pair of the library to the records in it.
+
+    Records are numbered once and each facet holds a sorted array of record
+    numbers, so a filter of a year window and a few journals resolves to an ID
+    allow-list with array unions and intersections instead of a metadata scan,
+    and facet counts are array lengths.
+
+    Records added later are numbered after all others and kept in a per-facet
+    delta, so adding a batch costs the size of the batch. A facet's delta is
+    appended to its array the next time the facet is read, which keeps the
+    array sorted without sorting it.
+    """
+
+    def __init__(self, ids: Sequence[str], journals: Sequence[str], years: Sequence[int]):
+        """
+        :param ids: the record IDs
+        :param journals: the journal of each record
+        :param years: the publication year of each record
+        """
+        self.ids: List[str] = list(ids)
+        self.journals: List[str] = list(journals)
+        self.years: List[int] = [int(year) for year in years]
+        self._lock = threading.RLock()
+
+        positions = defaultdict(list)
+        for number, (journal, year) in enumerate(zip(self.journals, self.years)):
+            positions[(journal, year)].append(number)
+        self._facets = {key: np.asarray(value, dtype=np.int32) for key, value in positions.items()}
+        # record numbers added since each facet was last read
+        self._pending = defaultdict(list)
+
+        self._by_journal = defaultdict(list)
+        for journal, year in self._facets:
+            self._by_journal[journal].append(year)
+
+        # record number by ID, built on first use
+        self._numbers = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, ids: Sequence[str], journals: Sequence[str], years: Sequence[int]):
+        """Cover more records"""
+        with self._lock:
+            for record_id, journal, year in zip(ids, journals, years):
+                number = len(self.ids)
+                key = (journal, int(year))
+                self.ids.append(record_id)
+                self.journals.append(journal)
+                self.years.append(key[1])
+                if key not in self._facets and key not in self._pending:
+                    self._by_journal[journal].append(key[1])
+                self._pending[key].append(number)
+                if self._numbers is not None:
+                    self._numbers[record_id] = number
+
+    def _facet(self, key) -> np.ndarray:
+        # callers hold the lock
+        pending = self._pending.pop(key, None)
+        if pending:
+            merged = np.asarray(pending, dtype=np.int32)
+            if key in self._facets:
+                merged = np.concatenate([self._facets[key], merged])
+            self._facets[key] = merged
+        return self._facets[key]
+
+    def _keys(self, year_range: Optional[Sequence[int]], journals: Optional[Iterable[str]]):
+        # callers hold the lock
+        selected = list(self._by_journal) if journals is None else journals
+        keys = []
+        for journal in selected:
+            for year in self._by_journal.get(journal, ()):
+                if year_range is None or year_range[0] <= year <= year_range[1]:
+                    keys.append((journal, year))
+        return keys
+
+    def resolve(self, year_range: Optional[Sequence[int]] = None, journals: Optional[Iterable[str]] = None) -> np.ndarray:
+        """
+        Record numbers that match the filters, sorted.
+
+        :param year_range: inclusive [first year, last year], or None for all years
+        :param journals: journal names to include, or None for all journals
+        """
+        with self._lock:
+            arrays = [self._facet(key) for key in self._keys(year_range, journals)]
+        if not arrays:
+            return np.empty(0, dtype=np.int32)
+        # every record is in exactly one facet, so the union needs no deduplication
+        return np.sort(np.concatenate(arrays))
+
+    def allowed_ids(self, year_range: Optional[Sequence[int]] = None, journals: Optional[Iterable[str]] = None,
+                    within: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        The IDs of the records that match the filters.
+
+        :param within: only keep these IDs, e.g. the matches of a phrase search
+        """
+        numbers = self.resolve(year_range, journals)
+        if within is not None:
+            numbers = np.intersect1d(numbers, self.numbers_of(within), assume_unique=True)
+        return [self.ids[number] for number in numbers]
+
+    def numbers_of(self, ids: Iterable[str]) -> np.ndarray:
+        with self._lock:
+            if self._numbers is None:
+                self._numbers = {record_id: number for number, record_id in enumerate(self.ids)}
+            return np.asarray(
+                sorted(self._numbers[record_id] for record_id in ids if record_id in self._numbers),
+                dtype=np.int32
+            )
+
+    def count(self, year_range: Optional[Sequence[int]] = None, journals: Optional[Iterable[str]] = None) -> int:
+        with self._lock:
+            return sum(len(self._facet(key)) for key in self._keys(year_range, journals))
+
+    def journal_counts(self, year_range: Optional[Sequence[int]] = None) -> Dict[str, int]:
+        """Number of records per journal within the year range"""
+        counts = defaultdict(int)
+        with self._lock:
+            for journal, year in self._keys(year_range, None):
+                counts[journal] += len(self._facet((journal, year)))
+        return dict(counts)
+
+    def save(self, path: str):
+        with self._lock:
+            ids, journals, years = list(self.ids), list(self.journals), list(self.years)
+        np.savez(
+            path,
+            ids=np.asarray(ids, dtype=str),
+            journals=np.asarray(journals, dtype=str),
+            years=np.asarray(years, dtype=np.int32)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'FacetIndex':
+        data = np.load(path, allow_pickle=False)
+        return cls(data['ids'].tolist(), data['journals'].tolist(), data['years'].tolist())
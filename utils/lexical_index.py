@@ -0,0 +1,322 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from utils.storage import SQLITE_LOOKUP_BATCH, open_sqlite
+
+_TOKEN = re.compile(r"\w+")
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# constant of reciprocal rank fusion; larger values flatten the rank curve
+RRF_K = 60
+
+# words too common to help ranking; a query's postings for them would be read
+# for almost no score
+STOPWORDS = frozenset(
+    "a an and are as at be been but by for from has have in is it its of on or "
+    "that the their these this to was were which with".split()
+)
+
+# terms found in more than this share of the searched records are skipped
+# when a query has other terms; their BM25 weight is close to nothing
+MAX_TERM_SHARE = 0.5
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """
+    Fuse several rankings of the same records into one.
+
+    :param rankings: lists of record IDs, best first
+    :param k: the fusion constant
+    :return: (record ID, fused score) pairs, best first
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, record_id in enumerate(ranking):
+            scores[record_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """
+    Positional inverted index kept in SQLite alongside a ChromaDB collection.
+
+    Every record is stored with its token count and, per term, the positions the
+    term occurs at. That is enough for BM25 ranking and for exact-phrase
+    matching, so neither needs a scan over the stored documents. Records can be
+    tagged with a group (e.g. the document a chunk belongs to) to restrict
+    searches and to delete them together.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn, self._lock = open_sqlite(
+            self.path,
+            "CREATE TABLE IF NOT EXISTS records ("
+            "id TEXT PRIMARY KEY, "
+            "grp TEXT, "
+            "length INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS records_grp ON records (grp);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term TEXT NOT NULL, "
+            "id TEXT NOT NULL, "
+            "tf INTEGER NOT NULL, "
+            "positions TEXT NOT NULL, "
+            "PRIMARY KEY (term, id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_id ON postings (id);"
+        )
+        # document frequency of every term, kept up to date on add and delete
+        # so ranking never has to count the postings
+        with self._lock:
+            has_terms = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'terms'"
+            ).fetchone()
+            if not has_terms:
+                self._conn.execute("CREATE TABLE terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID")
+                self._conn.execute("INSERT INTO terms (term, df) SELECT term, COUNT(*) FROM postings GROUP BY term")
+                self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def add(self, ids: List[str], texts: List[str], groups: Optional[List[Optional[str]]] = None):
+        """Index records, replacing any earlier version of the same IDs"""
+        if not ids:
+            return
+        groups = groups or [None] * len(ids)
+        records = []
+        postings = []
+        for record_id, text, group in zip(ids, texts, groups):
+            tokens = tokenize(text or "")
+            positions = defaultdict(list)
+            for position, token in enumerate(tokens):
+                positions[token].append(position)
+            records.append((record_id, group, len(tokens)))
+            postings += [
+                (term, record_id, len(term_positions), ",".join(map(str, term_positions)))
+                for term, term_positions in positions.items()
+            ]
+        with self._lock:
+            self._delete_ids(ids)
+            self._conn.executemany("INSERT INTO records (id, grp, length) VALUES (?, ?, ?)", records)
+            self._conn.executemany(
+                "INSERT INTO postings (term, id, tf, positions) VALUES (?, ?, ?, ?)",
+                postings
+            )
+            self._conn.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, ?) "
+                "ON CONFLICT (term) DO UPDATE SET df = df + excluded.df",
+                Counter(posting[0] for posting in postings).items()
+            )
+            self._conn.commit()
+
+    def group_ids(self, groups: Iterable[str]) -> Dict[str, List[str]]:
+        """IDs of the records in each of the given groups"""
+        groups = list(groups)
+        found = {group: [] for group in groups}
+        with self._lock:
+            for start in range(0, len(groups), SQLITE_LOOKUP_BATCH):
+                batch = groups[start:start + SQLITE_LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                for record_id, group in self._conn.execute(
+                        f"SELECT id, grp FROM records WHERE grp IN ({placeholders})", batch
+                ):
+                    found[group].append(record_id)
+        return found
+
+    def remove(self, ids: List[str]):
+        with self._lock:
+            self._delete_ids(ids)
+            self._conn.commit()
+
+    def remove_group(self, group: str):
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute("SELECT id FROM records WHERE grp = ?", (group,))]
+            self._delete_ids(ids)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM records")
+            self._conn.execute("DELETE FROM terms")
+            self._conn.commit()
+
+    def vacuum(self):
+        """Reclaim the space of deleted postings"""
+        with self._lock:
+            self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA optimize")
+
+    def _delete_ids(self, ids: List[str]):
+        # callers hold the lock and commit
+        for start in range(0, len(ids), SQLITE_LOOKUP_BATCH):
+            batch = ids[start:start + SQLITE_LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            removed = self._conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE id IN ({placeholders}) GROUP BY term", batch
+            ).fetchall()
+            self._conn.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(n, t) for t, n in removed])
+            self._conn.execute(f"DELETE FROM postings WHERE id IN ({placeholders})", batch)
+            self._conn.execute(f"DELETE FROM records WHERE id IN ({placeholders})", batch)
+        self._conn.execute("DELETE FROM terms WHERE df <= 0")
+
+    def _postings(self, term: str, groups: Optional[Iterable[str]] = None,
+                  positions: bool = False) -> List[Tuple]:
+        """
+        (id, tf, record length) of the records containing a term.
+
+        :param positions: also return each record's positions of the term,
+            which only phrase matching needs
+        """
+        columns = "p.id, p.tf, r.length, p.positions" if positions else "p.id, p.tf, r.length"
+        if groups is None:
+            with self._lock:
+                return self._conn.execute(
+                    f"SELECT {columns} FROM postings p "
+                    f"JOIN records r ON r.id = p.id WHERE p.term = ?",
+                    (term,)
+                ).fetchall()
+
+        # walk the groups' records and look each one up in the postings, so
+        # the cost follows the size of the groups, not the term's whole list;
+        # CROSS JOIN keeps SQLite from reordering the join
+        groups = list(groups)
+        found = []
+        with self._lock:
+            for start in range(0, len(groups), SQLITE_LOOKUP_BATCH):
+                batch = groups[start:start + SQLITE_LOOKUP_BATCH]
+                found += self._conn.execute(
+                    f"SELECT {columns} FROM records r "
+                    f"CROSS JOIN postings p ON p.term = ? AND p.id = r.id "
+                    f"WHERE r.grp IN ({','.join('?' * len(batch))})",
+                    [term, *batch]
+                ).fetchall()
+        return found
+
+    def _group_stats(self, groups: Optional[List[str]]) -> Tuple[int, float]:
+        """Number of records and their average length, in the groups or overall"""
+        with self._lock:
+            if groups is None:
+                return self._conn.execute("SELECT COUNT(*), AVG(length) FROM records").fetchone()
+            total, length = 0, 0
+            for start in range(0, len(groups), SQLITE_LOOKUP_BATCH):
+                batch = groups[start:start + SQLITE_LOOKUP_BATCH]
+                count, summed = self._conn.execute(
+                    f"SELECT COUNT(*), SUM(length) FROM records WHERE grp IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchone()
+                total += count
+                length += summed or 0
+        return total, (length / total if total else None)
+
+    def search(self, query: str, top_k: int = 10, groups: Optional[Iterable[str]] = None,
+               restrict_to: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Rank records against a query with BM25.
+
+        :param query: the free-text query
+        :param top_k: the number of records to return
+        :param groups: only search records in these groups; the statistics
+            are then those of the groups, so nothing outside them is read
+        :param restrict_to: only return these record IDs
+        :return: (record ID, score) pairs, best first
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        # a query of nothing but stopwords is still searched for them
+        terms = [term for term in terms if term not in STOPWORDS] or terms
+        if not terms:
+            return []
+        groups = list(groups) if groups is not None else None
+        total, average_length = self._group_stats(groups)
+        if not total:
+            return []
+        average_length = average_length or 1.0
+
+        if groups is None and len(terms) > 1:
+            # the stored frequencies tell which terms are too common to be
+            # worth reading before any of their postings are
+            frequencies = {term: self._document_frequency(term) for term in terms}
+            terms = [
+                term for term in terms if frequencies[term] <= MAX_TERM_SHARE * total
+            ] or [min(terms, key=frequencies.get)]
+
+        scores = defaultdict(float)
+        for term in terms:
+            postings = self._postings(term, groups)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for record_id, tf, length in postings:
+                if restrict_to is not None and record_id not in restrict_to:
+                    continue
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                scores[record_id] += idf * tf * (BM25_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def phrase_ids(self, phrase: str, groups: Optional[Iterable[str]] = None) -> Set[str]:
+        """IDs of the records that contain the phrase as consecutive words"""
+        terms = tokenize(phrase)
+        if not terms:
+            return set()
+        groups = list(groups) if groups is not None else None
+
+        # positions of each phrase word, per record, intersected rarest word first
+        positions: List[Dict[str, Set[int]]] = [None] * len(terms)
+        candidates = None
+        # the global frequencies are only worth reading when the whole index is searched
+        order = range(len(terms)) if groups is not None else sorted(
+            range(len(terms)), key=lambda i: self._document_frequency(terms[i])
+        )
+        for offset in order:
+            postings = self._postings(terms[offset], groups, positions=True)
+            positions[offset] = {
+                record_id: set(map(int, term_positions.split(",")))
+                for record_id, _, _, term_positions in postings
+                if candidates is None or record_id in candidates
+            }
+            candidates = set(positions[offset])
+            if not candidates:
+                return set()
+
+        return {
+            record_id for record_id in candidates
+            if any(
+                all(start + offset in positions[offset][record_id] for offset in range(1, len(terms)))
+                for start in positions[0][record_id]
+            )
+        }
+
+    def match(self, phrases: List[str], operator: str = "AND", groups: Optional[Iterable[str]] = None) -> Set[str]:
+        """
+        IDs of the records matching a boolean combination of phrases.
+
+        :param phrases: the exact phrases to look for
+        :param operator: "AND" to require every phrase, "OR" for any of them
+        :param groups: only match records in these groups
+        """
+        groups = list(groups) if groups is not None else None
+        result = None
+        for phrase in phrases:
+            ids = self.phrase_ids(phrase, groups)
+            if operator == "OR":
+                result = ids if result is None else result | ids
+            else:
+                result = ids if result is None else result & ids
+                if not result:
+                    break
+        return result or set()
+
+    def _document_frequency(self, term: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+        return row[0] if row else 0
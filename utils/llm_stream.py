@@ -0,0 +1,216 @@
+"""
+Asynchronous streaming client for OpenRouter chat completions.
+
+Responses are parsed as server-sent events: keep-alive comments are ignored,
+multi-line ``data:`` fields are joined, and ``[DONE]`` ends the stream. All
+streams share one ``httpx.AsyncClient`` running on a background event loop, so
+several completions can stream at the same time without a thread per request.
+Synchronous Streamlit code uses ``stream_completion`` and ``stream_many``.
+"""
+import asyncio
+import json
+import queue
+import random
+import threading
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+import httpx
+import streamlit as st
+from utils.ai import OPENROUTER_URL, completion_body, get_timeouts, openrouter_headers
+
+# attempts to open a stream before giving up, as with ai_completion's retries
+MAX_ATTEMPTS = 5
+
+_DONE = object()
+
+
+class StreamError(Exception):
+    """The completion could not be streamed from the API"""
+
+
+class SSEParser:
+    """Incremental parser for a text/event-stream body"""
+
+    def __init__(self):
+        self._data = []
+
+    def feed(self, line: str) -> Optional[str]:
+        """
+        Consume one line of the stream.
+
+        :return: the data of the event completed by this line, if any
+        """
+        line = line.rstrip("\r\n")
+        if not line:
+            # a blank line dispatches the event
+            if not self._data:
+                return None
+            data = "\n".join(self._data)
+            self._data = []
+            return data
+        if line.startswith(":"):
+            # comment, e.g. ": OPENROUTER PROCESSING" keep-alives
+            return None
+        field, _, value = line.partition(":")
+        if field == "data":
+            self._data.append(value[1:] if value.startswith(" ") else value)
+        return None
+
+    def flush(self) -> Optional[str]:
+        """Return the pending event when the stream ends without a blank line"""
+        return self.feed("")
+
+
+def parse_delta(data: str) -> Optional[str]:
+    """Extract the content delta from the data of one completion event"""
+    message = json.loads(data, strict=False)
+    if message.get('error'):
+        # providers send either an error object or just its message
+        error = message['error']
+        raise StreamError(error.get('message', str(error)) if isinstance(error, dict) else str(error))
+    choices = message.get('choices') or []
+    if not choices:
+        return None
+    return (choices[0].get('delta') or {}).get('content') or None
+
+
+class StreamingClient:
+    """Streams chat completions over a shared, pooled async HTTP client"""
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-stream-loop", daemon=True)
+        self._thread.start()
+        self._client = self.run(self._create_client(*get_timeouts()))
+
+    async def _create_client(self, connect_timeout: float, read_timeout: float) -> httpx.AsyncClient:
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            http2 = False
+        return httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=8),
+        )
+
+    def run(self, coroutine):
+        """Run a coroutine on the client's event loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def stream(
+            self,
+            messages: list,
+            model: str,
+            temperature: float = 0.3,
+            headers: Optional[dict] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream the content deltas of a chat completion.
+
+        Opening the stream is retried with backoff; once content has started
+        arriving, errors are raised to the caller.
+
+        :param messages: the chat messages to send
+        :param model: the OpenRouter model name
+        :param temperature: the sampling temperature
+        :param headers: request headers; read from the app secrets when omitted
+        """
+        headers = headers or openrouter_headers()
+        body = completion_body(messages, model, temperature, stream=True)
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            started = False
+            try:
+                async with self._client.stream("POST", OPENROUTER_URL, headers=headers, json=body) as response:
+                    if response.status_code != 200:
+                        error = await response.aread()
+                        raise StreamError(f"{response.status_code}: {error.decode('utf-8', 'replace')}")
+
+                    parser = SSEParser()
+                    async for line in response.aiter_lines():
+                        data = parser.feed(line)
+                        if data is None:
+                            continue
+                        if data.strip() == "[DONE]":
+                            return
+                        delta = parse_delta(data)
+                        if delta:
+                            started = True
+                            yield delta
+
+                    # the stream ended without a final blank line
+                    data = parser.flush()
+                    if data and data.strip() != "[DONE]":
+                        delta = parse_delta(data)
+                        if delta:
+                            yield delta
+                    return
+            except (StreamError, httpx.TransportError):
+                if started or attempt == MAX_ATTEMPTS:
+                    raise
+                await asyncio.sleep(random.uniform(2, 10))
+
+    async def complete(self, messages: list, model: str, temperature: float = 0.3, headers: Optional[dict] = None) -> str:
+        """Collect a whole streamed completion"""
+        return "".join([delta async for delta in self.stream(messages, model, temperature, headers)])
+
+    def iter_stream(self, streams: List[AsyncIterator[str]]) -> Iterator[Tuple[int, str]]:
+        """
+        Consume async delta streams from synchronous code.
+
+        :return: (stream index, delta) pairs in the order they arrive
+        """
+        deltas = queue.Queue()
+
+        async def pump(index: int, stream: AsyncIterator[str]):
+            try:
+                async for delta in stream:
+                    deltas.put((index, delta))
+            except Exception as e:
+                deltas.put((index, e))
+            finally:
+                deltas.put((index, _DONE))
+
+        futures = [asyncio.run_coroutine_threadsafe(pump(i, s), self._loop) for i, s in enumerate(streams)]
+        remaining = len(futures)
+        try:
+            while remaining:
+                index, item = deltas.get()
+                if item is _DONE:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield index, item
+        finally:
+            # stop streams the caller is no longer reading
+            for future in futures:
+                future.cancel()
+
+
+@st.cache_resource
+def get_streaming_client() -> StreamingClient:
+    """The streaming client shared by all reruns and sessions"""
+    return StreamingClient()
+
+
+def stream_completion(messages: list, model: str, temperature: float = 0.3) -> Iterator[str]:
+    """Stream the content deltas of one chat completion"""
+    client = get_streaming_client()
+    stream = client.stream(messages, model, temperature, openrouter_headers())
+    for _, delta in client.iter_stream([stream]):
+        yield delta
+
+
+def stream_many(requests: List[list], model: str, temperature: float = 0.3) -> Iterator[Tuple[int, str]]:
+    """
+    Stream several chat completions at the same time.
+
+    :param requests: one list of chat messages per completion
+    :return: (request index, delta) pairs in the order they arrive
+    """
+    client = get_streaming_client()
+    headers = openrouter_headers()
+    streams = [client.stream(messages, model, temperature, headers) for messages in requests]
+    yield from client.iter_stream(streams)
@@ -0,0 +1,215 @@
+"""
+Lightweight PDF parsing helpers.
+
+This module deliberately avoids importing streamlit or chromadb so that it can be
+loaded cheaply inside worker processes used for parallel PDF ingestion.
+"""
+import hashlib
+import io
+import re
+from typing import Dict, Any, List, Optional
+from pypdf import PdfReader
+from utils.text_splitter import CharacterTextSplitter, TextChunk
+
+
+# Number of leading words kept as the abstract of an uploaded PDF
+ABSTRACT_WORDS = 500
+
+# Number of leading characters kept for title and citation extraction
+HEAD_CHARS = 3000
+
+# A DOI: the 10. prefix, a registrant code and any suffix up to whitespace
+DOI_PATTERN = re.compile(r'\b(10\.\d{4,9}/[^\s"<>]+)', re.IGNORECASE)
+
+# Document information entries that publishers put the DOI in
+DOI_INFO_KEYS = ('/doi', '/DOI', '/Subject', '/Keywords', '/Title', '/Identifier')
+
+
+def find_doi(text: str) -> Optional[str]:
+    """The first DOI in a text, without trailing punctuation"""
+    match = DOI_PATTERN.search(text or "")
+    if not match:
+        return None
+    return match.group(1).rstrip('.,;:)]}\'')
+
+
+def metadata_doi(pdf_reader: PdfReader) -> Optional[str]:
+    """The DOI in a PDF's document information or XMP metadata, if any"""
+    try:
+        info = pdf_reader.metadata or {}
+        for key in DOI_INFO_KEYS:
+            doi = find_doi(str(info.get(key, '')))
+            if doi:
+                return doi
+
+        xmp = pdf_reader.trailer['/Root'].get('/Metadata')
+        if xmp is not None:
+            return find_doi(xmp.get_object().get_data().decode('utf-8', errors='ignore'))
+    except Exception:
+        # broken metadata is common and never worth failing the upload for
+        pass
+    return None
+
+
+class PdfTextStats:
+    """Document-level statistics of a PDF, accumulated one page at a time"""
+
+    def __init__(self):
+        self.num_pages = 0
+        self.word_count = 0
+        self._abstract_words = []
+        self._head = []
+        self._head_length = 0
+        self._hash = hashlib.sha256()
+        self._hashed_words = False
+        self._first_page = ""
+        self.metadata_doi = None
+
+    def add_page(self, page_text: str):
+        self.num_pages += 1
+        if self.num_pages == 1:
+            self._first_page = page_text
+
+        if self._head_length < HEAD_CHARS:
+            self._head.append(page_text + "\n")
+            self._head_length += len(page_text) + 1
+
+        words = page_text.split()
+        self.word_count += len(words)
+        if len(self._abstract_words) < ABSTRACT_WORDS:
+            self._abstract_words.extend(words[:ABSTRACT_WORDS - len(self._abstract_words)])
+
+        # same digest as text_fingerprint() over the whole text
+        if words:
+            if self._hashed_words:
+                self._hash.update(b" ")
+            self._hash.update(" ".join(words).lower().encode("utf-8"))
+            self._hashed_words = True
+
+    @property
+    def head_complete(self) -> bool:
+        return self._head_length >= HEAD_CHARS
+
+    @property
+    def head_text(self) -> str:
+        return "".join(self._head)[:HEAD_CHARS]
+
+    @property
+    def abstract(self) -> str:
+        return " ".join(self._abstract_words)
+
+    @property
+    def fingerprint(self) -> str:
+        return self._hash.hexdigest()
+
+    @property
+    def doi(self) -> Optional[str]:
+        """The DOI of the PDF from its metadata, or else from its first page"""
+        return self.metadata_doi or find_doi(self._first_page)
+
+
+def _page_chunks(text_splitter: CharacterTextSplitter, page_num: int, page_text: str) -> List[TextChunk]:
+    """The chunks of one page, tagged with the page number"""
+    docs = text_splitter.create_documents([page_text])
+    for doc_idx, doc in enumerate(docs):
+        doc.metadata['page_number'] = page_num + 1
+        doc.metadata['chunk_id'] = f"page_{page_num + 1}_chunk_{doc_idx}"
+    return docs
+
+
+def extract_pdf_pages(
+        data: bytes,
+        start: int = 0,
+        max_pages: Optional[int] = None,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200
+) -> Dict[str, Any]:
+    """
+    Extract and chunk a range of a PDF's pages.
+
+    Meant to run in a worker process: a long PDF is read as several ranges,
+    so only one range's text is in memory (and in transit) at a time.
+
+    :param data: raw bytes of the PDF file
+    :param start: index of the first page to read
+    :param max_pages: number of pages to read, or None for the rest of the PDF
+    :param chunk_size: maximum number of characters per chunk
+    :param chunk_overlap: number of characters shared between consecutive chunks
+    :return: a dict with the PDF's page count, its metadata DOI (read with
+        the first page only) and a (text, chunks) pair per page read
+    """
+    text_splitter = CharacterTextSplitter(
+        separator="\n",
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
+    )
+    pdf_reader = PdfReader(io.BytesIO(data))
+    num_pages = len(pdf_reader.pages)
+    end = num_pages if max_pages is None else min(num_pages, start + max_pages)
+
+    pages = []
+    for page_num in range(start, end):
+        page_text = pdf_reader.pages[page_num].extract_text()
+        pages.append((page_text, _page_chunks(text_splitter, page_num, page_text)))
+
+    return {
+        'num_pages': num_pages,
+        'metadata_doi': metadata_doi(pdf_reader) if start == 0 else None,
+        'pages': pages
+    }
+
+
+def read_extracted_pages(stats: PdfTextStats, extracted: Dict[str, Any]) -> List[TextChunk]:
+    """
+    Add a range from extract_pdf_pages() to the statistics and return its chunks.
+
+    Ranges must be read in page order.
+    """
+    if extracted['metadata_doi']:
+        stats.metadata_doi = extracted['metadata_doi']
+    chunks = []
+    for page_text, page_chunks in extracted['pages']:
+        stats.add_page(page_text)
+        chunks += page_chunks
+    return chunks
+
+
+def parsed_pdf(stats: PdfTextStats, chunks: List[TextChunk]) -> Dict[str, Any]:
+    """The dict parse_pdf() returns, for a PDF whose pages were all read"""
+    return {
+        'fingerprint': stats.fingerprint,
+        'abstract': stats.abstract,
+        'head_text': stats.head_text,
+        'doi': stats.doi,
+        'chunks': chunks,
+        'num_pages': stats.num_pages,
+        'word_count': stats.word_count
+    }
+
+
+def parse_pdf(data: bytes, chunk_size: int = 1000, chunk_overlap: int = 200) -> Dict[str, Any]:
+    """
+    Extract the chunks of a PDF along with its document-level statistics.
+
+    The full text is never assembled; only the first characters are kept for
+    title and citation extraction.
+
+    :param data: raw bytes of the PDF file
+    :param chunk_size: maximum number of characters per chunk
+    :param chunk_overlap: number of characters shared between consecutive chunks
+    :return: a dict with the chunks, abstract, head text, DOI, page and word counts
+    """
+    stats = PdfTextStats()
+    chunks = read_extracted_pages(stats, extract_pdf_pages(data, 0, None, chunk_size, chunk_overlap))
+    return parsed_pdf(stats, chunks)
+
+
+def file_fingerprint(data: bytes) -> str:
+    """SHA-256 of the raw file bytes; identical uploads share this value"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def text_fingerprint(text: str) -> str:
+    """SHA-256 of the case- and whitespace-normalized text of a document"""
+    normalized = " ".join(text.lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
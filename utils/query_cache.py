@@ -0,0 +1,93 @@
+import copy
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+import streamlit as st
+
+# seconds a cached result stays valid and the number of results kept
+DEFAULT_TTL = 900
+DEFAULT_MAX_ENTRIES = 512
+
+_MISSING = object()
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", (query or "").strip().lower())
+
+
+class QueryCache:
+    """
+    Process-wide LRU cache of search results with a time to live.
+
+    Results are keyed by (namespace, normalized query, filters, collection
+    version). Each namespace has a version that is bumped when its collection
+    changes, so results computed before a document was added or removed are
+    never served again.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def version(self, namespace: str) -> int:
+        with self._lock:
+            return self._versions.get(namespace, 0)
+
+    def invalidate(self, namespace: str):
+        """Forget every result of a namespace after its collection changed"""
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+
+    def _key(self, namespace: str, query: str, filters: Any, version: Any) -> tuple:
+        if version is None:
+            version = self._versions.get(namespace, 0)
+        return (
+            namespace,
+            normalize_query(query),
+            json.dumps(filters, sort_keys=True, default=str),
+            version,
+        )
+
+    def get(self, namespace: str, query: str, filters: Any = None, version: Any = None) -> Optional[Any]:
+        """
+        Return a copy of the cached result, or None if it is missing or expired.
+
+        :param namespace: the collection the result comes from
+        :param query: the search text
+        :param filters: any JSON-serializable filters the result depends on
+        :param version: an explicit collection version, e.g. its record count
+        """
+        with self._lock:
+            key = self._key(namespace, query, filters, version)
+            stored_at, value = self._entries.get(key, (0, _MISSING))
+            if value is _MISSING:
+                return None
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # callers may modify the results they get
+        return copy.deepcopy(value)
+
+    def put(self, namespace: str, query: str, filters: Any, value: Any, version: Any = None):
+        value = copy.deepcopy(value)
+        with self._lock:
+            key = self._key(namespace, query, filters, version)
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+@st.cache_resource
+def get_query_cache() -> QueryCache:
+    """The query cache shared by all reruns and sessions"""
+    return QueryCache()
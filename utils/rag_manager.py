@@ -1,15 +1,33 @@
 import streamlit as st
 import time
-from typing import List, Dict, Any, Optional
-from pypdf import PdfReader
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from utils.text_splitter import CharacterTextSplitter
+from utils.pdf_parsing import (
+    parse_pdf, extract_pdf_pages, read_extracted_pages, parsed_pdf,
+    file_fingerprint, text_fingerprint, PdfTextStats
+)
 try:
     from utils.documentSearch import openai_ef
 except ImportError:
     openai_ef = None
 from utils.ai import ai_completion
 from utils.doi import get_citation
+from utils.citation_resolver import PdfCitationCache
+from utils.embedding_writer import EmbeddingWriter
+from utils.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from utils.document_store import DocumentStore
+from utils.query_cache import get_query_cache
+from utils.reranker import Reranker, create_reranker
+from utils.vector_store import get_vector_store
 import json
+import os
+from collections import OrderedDict
+from itertools import chain
+import numpy as np
 import re
 
 # SQLite module replacement for ChromaDB compatibility
@@ -28,6 +46,125 @@ except ImportError as e:
     st.error(f"ChromaDB import failed: {e}")
     CHROMADB_AVAILABLE = False
 
+# Number of PDFs processed at the same time when several files are uploaded
+MAX_CONCURRENT_PDFS = 4
+
+# Serializes concurrent ingestion of the same file so it is only stored once; a
+# fixed set of locks striped by file hash keeps memory flat however many files
+# are uploaded (different files that share a stripe just wait for each other)
+FINGERPRINT_LOCK_STRIPES = 64
+_fingerprint_locks = [threading.Lock() for _ in range(FINGERPRINT_LOCK_STRIPES)]
+
+
+# PDFs longer than this are streamed into the vector store, this many pages
+# at a time; each range is extracted in the parse pool
+STREAMING_PAGE_THRESHOLD = 50
+
+# Number of chunks written to ChromaDB at a time while streaming
+STREAM_BATCH_SIZE = 64
+
+# Collection of the uploaded PDFs' chunks, and its lexical index and document sidecars,
+# kept next to the vector store (in the data directory when the store is durable)
+RAG_COLLECTION = "research_papers"
+LEXICAL_INDEX_NAME = "chromadb_lexical.sqlite3"
+DOCUMENT_STORE_NAME = "chromadb_documents.sqlite3"
+
+# Each retriever contributes this many candidates per requested result to the fusion
+HYBRID_CANDIDATE_FACTOR = 4
+HYBRID_MIN_CANDIDATES = 20
+
+# Fused candidates passed to the reranker, if one is configured, of which
+# only top_k reach the prompt
+RERANK_CANDIDATES = 50
+
+# Queries scoped to documents with at most this many chunks in total are answered
+# by exact search over just those chunks' vectors instead of the shared ANN index
+SCOPED_SEARCH_MAX_CHUNKS = 20000
+
+# Documents whose chunk vectors are kept in memory for scoped search
+SCOPED_VECTOR_CACHE_SIZE = 64
+
+# Deleted chunks after which the sidecar indexes are compacted in the background
+COMPACTION_CHURN = 2000
+
+# Chunks read from ChromaDB at a time when the lexical index is rebuilt
+INDEX_SYNC_BATCH_SIZE = 1000
+
+# Anonymous owners only last as long as their browser session; their claims
+# expire after this many seconds, and documents nobody else claimed go with them
+ANONYMOUS_OWNER_PREFIX = "anon:"
+ANONYMOUS_OWNER_TTL = 7 * 24 * 3600
+
+
+def _session_owner() -> Optional[str]:
+    """The owner of the current session's uploads: the signed-in user, or else the anonymous session"""
+    user = st.session_state.get('user')
+    if user and user.get('localId'):
+        return user['localId']
+    return st.session_state.get('rag_owner')
+
+
+def _fingerprint_lock(file_hash: str) -> threading.Lock:
+    return _fingerprint_locks[int(file_hash[:8], 16) % FINGERPRINT_LOCK_STRIPES]
+
+
+@st.cache_resource
+def _get_parse_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all sessions for CPU-bound PDF parsing"""
+    # spawn keeps the workers free of the parent's threads and open clients
+    return ProcessPoolExecutor(
+        max_workers=MAX_CONCURRENT_PDFS,
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def _parse_pool_or_none() -> Optional[ProcessPoolExecutor]:
+    try:
+        return _get_parse_pool()
+    except Exception:
+        # fall back to parsing in the calling thread
+        return None
+
+
+def _sidecar_path(name: str) -> str:
+    """The path of a sidecar of the PDF collection; in memory when the collection is not durable"""
+    try:
+        store = get_vector_store() if CHROMADB_AVAILABLE else None
+    except Exception:
+        store = None
+    return store.sidecar_path(name) if store else ":memory:"
+
+
+@st.cache_resource
+def _get_lexical_index() -> LexicalIndex:
+    """BM25 and phrase index over the stored PDF chunks"""
+    return LexicalIndex(_sidecar_path(LEXICAL_INDEX_NAME))
+
+
+@st.cache_resource
+def _get_document_store() -> DocumentStore:
+    """Per-document metadata of the ingested PDFs"""
+    return DocumentStore(_sidecar_path(DOCUMENT_STORE_NAME))
+
+
+@st.cache_resource
+def _get_pdf_citation_cache() -> PdfCitationCache:
+    """Citation metadata extracted from PDFs, by content hash"""
+    return PdfCitationCache()
+
+
+@st.cache_resource
+def _get_reranker() -> Optional[Reranker]:
+    """
+    Second-stage reranker shared by all sessions.
+
+    Set RERANKER = "cross-encoder" (and optionally RERANKER_MODEL) in secrets to
+    use a local cross-encoder, or "lexical" for the keyword reranker; by
+    default there is none and the fused order is kept.
+    """
+    return create_reranker(st.secrets.get("RERANKER"), st.secrets.get("RERANKER_MODEL"))
+
+
 class RAGManager:
     """Manages RAG functionality for multiple PDFs using ChromaDB"""
     
@@ -38,10 +175,23 @@ class RAGManager:
             chunk_overlap=200
         )
         self.collection = self._get_collection()
+        self.embedding_writer = EmbeddingWriter(openai_ef) if openai_ef else None
+        self.lexical_index = _get_lexical_index()
+        self.document_store = _get_document_store()
+        self.citation_cache = _get_pdf_citation_cache()
+        # doc_id -> (chunk IDs, unit-length chunk vectors) for scoped search
+        self._doc_vectors = OrderedDict()
+        self._doc_vectors_lock = threading.Lock()
+        # chunks deleted since the last compaction
+        self._churn = 0
+        self._churn_lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._sync_lexical_index()
+        self._sync_document_store()
+        self._expire_anonymous_owners()
     
-    @st.cache_resource
-    def _get_collection(_self):
-        """Initialize ChromaDB collection for PDF storage"""
+    def _get_collection(self):
+        """The PDF collection of the process-wide vector store"""
         if not CHROMADB_AVAILABLE:
             st.error("ChromaDB is not available. RAG functionality will be disabled.")
             return None
@@ -51,72 +201,81 @@ class RAGManager:
             return None
             
         try:
-            if 'rag_client' not in st.session_state:
-                # Try persistent client first
-                try:
-                    import tempfile
-                    import os
-                    
-                    # Create a persistent directory for ChromaDB
-                    chroma_dir = os.path.join(tempfile.gettempdir(), "aira_chromadb")
-                    os.makedirs(chroma_dir, exist_ok=True)
-                    
-                    st.session_state.rag_client = chromadb.PersistentClient(path=chroma_dir)
-                    st.success("✅ ChromaDB persistent client initialized successfully")
-                    
-                except Exception as persistent_error:
-                    st.warning(f"Persistent client failed: {persistent_error}. Trying in-memory client...")
-                    # Fallback to in-memory client
-                    st.session_state.rag_client = chromadb.Client()
-                    st.info("📝 Using ChromaDB in-memory client (data will not persist)")
-            
-            collection = st.session_state.rag_client.get_or_create_collection(
-                "research_papers",
-                embedding_function=openai_ef
-            )
-            return collection
-            
+            return get_vector_store().collection(RAG_COLLECTION, embedding_function=openai_ef)
         except Exception as e:
             st.error(f"❌ ChromaDB initialization completely failed: {str(e)}")
             st.error("RAG functionality will be disabled. Please check your ChromaDB installation.")
             return None
+
+    def _sync_lexical_index(self):
+        """
+        Rebuild the lexical index if it does not cover the same chunks as the collection.
+
+        An empty collection never clears the index: it is far more likely to
+        be a collection that could not be opened than one emptied behind the
+        index's back, since deletions go through both.
+        """
+        if not self.collection:
+            return
+        try:
+            total = self.collection.count()
+            if total == 0 or total == self.lexical_index.count():
+                return
+            self.lexical_index.clear()
+            for offset in range(0, total, INDEX_SYNC_BATCH_SIZE):
+                batch = self.collection.get(
+                    include=['documents', 'metadatas'],
+                    limit=INDEX_SYNC_BATCH_SIZE,
+                    offset=offset
+                )
+                self.lexical_index.add(
+                    batch['ids'],
+                    batch['documents'],
+                    [metadata.get('doc_id') for metadata in batch['metadatas']]
+                )
+        except Exception as e:
+            st.warning(f"Could not rebuild the keyword index: {str(e)}")
+
+    def _sync_document_store(self):
+        """
+        Bring the document store in line with the collection.
+
+        Documents stored before the sidecar existed are recovered from the
+        metadata of their first chunk. An empty collection leaves the store
+        alone, for the same reason as in _sync_lexical_index.
+        """
+        if not self.collection:
+            return
+        try:
+            if self.collection.count() == 0 or self.document_store.count() > 0:
+                return
+            first_chunks = self.collection.get(where={"chunk_index": 0}, include=['metadatas'])
+            for metadata in first_chunks['metadatas']:
+                # only finalized documents carry the document-level fields
+                if metadata.get('file_hash'):
+                    self.document_store.upsert(self._document_from_metadata(metadata))
+        except Exception as e:
+            st.warning(f"Could not load the document list: {str(e)}")
     
     def extract_pdf_text(self, uploaded_file) -> Dict[str, Any]:
         """Extract text from uploaded PDF file"""
         try:
-            pdf_reader = PdfReader(uploaded_file)
-            all_text = ""
-            pdf_chunks = []
-            
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                all_text += page_text + "\n"
-                
-                # Create chunks for this page
-                docs = self.text_splitter.create_documents([page_text])
-                for doc_idx, doc in enumerate(docs):
-                    doc.metadata['page_number'] = page_num + 1
-                    doc.metadata['chunk_id'] = f"page_{page_num + 1}_chunk_{doc_idx}"
-                    pdf_chunks.append(doc)
-            
-            # Extract title from first page
-            title = self._extract_title_from_text(all_text[:2000])
-            
-            # Get first 500 words as abstract
-            words = all_text.split()
-            abstract = " ".join(words[:500]) if len(words) >= 500 else all_text
-            
-            return {
-                'title': title,
-                'abstract': abstract,
-                'full_text': all_text,
-                'chunks': pdf_chunks,
-                'num_pages': len(pdf_reader.pages),
-                'word_count': len(words)
-            }
-            
+            uploaded_file.seek(0)
+            return self._parse_pdf_bytes(uploaded_file.read())
         except Exception as e:
             raise Exception(f"Error extracting PDF text: {str(e)}")
+
+    def _parse_pdf_bytes(self, data: bytes, parse_pool: Optional[ProcessPoolExecutor] = None) -> Dict[str, Any]:
+        """Parse raw PDF bytes, optionally in the shared process pool"""
+        args = (data, self.text_splitter.chunk_size, self.text_splitter.chunk_overlap)
+        if parse_pool is not None:
+            pdf_data = parse_pool.submit(parse_pdf, *args).result()
+        else:
+            pdf_data = parse_pdf(*args)
+
+        # Extract title from first page
+        pdf_data['title'] = self._extract_title_from_text(pdf_data['head_text'][:2000])
+        return pdf_data
     
     def _extract_title_from_text(self, text: str) -> str:
         """Extract title from the beginning of the PDF text"""
@@ -136,8 +295,21 @@ class RAGManager:
         except:
             return "Uploaded Document"
     
-    def _extract_citation_with_ai(self, text: str) -> Dict[str, str]:
-        """Use AI to extract citation information from PDF text"""
+    def _extract_citation_with_ai(self, text: str, file_hash: Optional[str] = None) -> Dict[str, str]:
+        """
+        Use AI to extract citation information from PDF text.
+
+        Results are cached by the PDF's content hash, or by the hash of the
+        text when the file is not known, so the LLM is asked once per paper.
+
+        :param text: the first pages of the PDF
+        :param file_hash: SHA-256 of the PDF file
+        """
+        cache_key = f"file:{file_hash}" if file_hash else f"text:{text_fingerprint(text[:3000])}"
+        cached = self.citation_cache.get(cache_key)
+        if cached:
+            return cached
+
         try:
             prompt = f"""
             Extract bibliographic information from this academic paper text and return it as a JSON object.
@@ -174,6 +346,7 @@ class RAGManager:
             
             if start_idx != -1 and end_idx != -1:
                 citation_json = json.loads(citation_text[start_idx:end_idx])
+                self.citation_cache.put(cache_key, citation_json)
                 return citation_json
             else:
                 return self._default_citation()
@@ -194,64 +367,355 @@ class RAGManager:
             "short_citation": f"Unknown, {current_year}"
         }
     
-    def add_pdf_to_rag(self, uploaded_file, doi_input: Optional[str] = None) -> Dict[str, Any]:
-        """Add a PDF to the RAG system"""
+    def add_pdf_to_rag(
+            self,
+            uploaded_file,
+            doi_input: Optional[str] = None,
+            owner: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Add a PDF to the RAG system.
+
+        :param owner: the owner the document is recorded for; defaults to the current session
+        """
         try:
-            # Extract text and metadata
-            pdf_data = self.extract_pdf_text(uploaded_file)
-            
-            # Get citation information
-            if doi_input and doi_input.strip():
-                try:
-                    full_citation = get_citation(doi_input.strip())
-                    # Parse the citation to extract components
-                    citation_info = self._parse_citation(full_citation)
-                    citation_info['doi'] = doi_input.strip()
-                except:
-                    st.warning("Could not retrieve citation from DOI, using AI extraction...")
-                    citation_info = self._extract_citation_with_ai(pdf_data['full_text'])
-                    citation_info['doi'] = doi_input.strip()
-            else:
-                citation_info = self._extract_citation_with_ai(pdf_data['full_text'])
-                citation_info['doi'] = f"uploaded_{int(time.time())}"
-            
-            # Create document ID
-            doc_id = f"pdf_{int(time.time())}"
-            
-            # Create document object
-            document = {
-                'id': doc_id,
-                'title': citation_info.get('title', pdf_data['title']),
-                'authors': citation_info.get('authors', 'Unknown Authors'),
-                'year': citation_info.get('year', str(time.localtime().tm_year)),
-                'journal': citation_info.get('journal', 'Unknown Journal'),
-                'doi': citation_info.get('doi', doc_id),
-                'citation': citation_info.get('full_citation', f"Unknown ({citation_info.get('year', '2024')}). {pdf_data['title']}."),
-                'short_citation': citation_info.get('short_citation', f"Unknown, {citation_info.get('year', '2024')}"),
-                'abstract': pdf_data['abstract'],  # First 500 words
-                'full_text': pdf_data['full_text'],
-                'num_pages': pdf_data['num_pages'],
-                'word_count': pdf_data['word_count'],
-                'type': 'pdf',
-                'source': 'uploaded',
-                'upload_time': time.time()
-            }
-            
-            # Store chunks in ChromaDB
-            self._store_chunks_in_chromadb(document, pdf_data['chunks'])
-            
-            return {
-                'success': True,
-                'document': document,
-                'message': f"✅ Successfully added '{document['title'][:50]}...' to RAG system ({pdf_data['num_pages']} pages, {pdf_data['word_count']} words)"
-            }
-            
+            uploaded_file.seek(0)
+            result = self._ingest_pdf_bytes(uploaded_file.read(), doi_input, _parse_pool_or_none())
+            self._claim_document(result, owner or _session_owner())
+            return result
+
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e),
                 'message': f"❌ Error adding PDF to RAG: {str(e)}"
             }
+
+    def add_pdfs_to_rag(
+            self,
+            uploaded_files: List[Any],
+            doi_input: Optional[str] = None,
+            max_workers: int = MAX_CONCURRENT_PDFS,
+            owner: Optional[str] = None
+    ) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        """
+        Add several PDFs to the RAG system concurrently.
+
+        Parsing runs in a process pool while the citation and embedding calls of
+        different files overlap in a bounded thread pool. Results are yielded as
+        soon as each file finishes, so callers can report progress per file.
+
+        :param uploaded_files: the uploaded PDF files
+        :param doi_input: optional DOI, applied to the first file only
+        :param max_workers: maximum number of files processed at the same time
+        :param owner: the owner the documents are recorded for; defaults to the current session
+        :return: iterator of (uploaded_file, result) pairs in completion order
+        """
+        if not uploaded_files:
+            return
+        owner = owner or _session_owner()
+        parse_pool = _parse_pool_or_none()
+
+        # read the files up front: uploaded files are not safe to share between threads
+        payloads = []
+        for uploaded_file in uploaded_files:
+            uploaded_file.seek(0)
+            payloads.append(uploaded_file.read())
+
+        # let worker threads report warnings into the current Streamlit session
+        ctx = get_script_run_ctx()
+
+        def attach_context():
+            add_script_run_ctx(threading.current_thread(), ctx)
+
+        def ingest(data: bytes, file_doi: Optional[str]) -> Dict[str, Any]:
+            try:
+                return self._ingest_pdf_bytes(data, file_doi, parse_pool)
+            except Exception as e:
+                return {
+                    'success': False,
+                    'error': str(e),
+                    'message': f"❌ Error adding PDF to RAG: {str(e)}"
+                }
+
+        workers = max(1, min(max_workers, len(uploaded_files)))
+        with ThreadPoolExecutor(max_workers=workers, initializer=attach_context) as pool:
+            futures = {
+                pool.submit(ingest, data, doi_input if i == 0 else None): uploaded_file
+                for i, (uploaded_file, data) in enumerate(zip(uploaded_files, payloads))
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                self._claim_document(result, owner)
+                yield futures[future], result
+
+    def _claim_document(self, result: Dict[str, Any], owner: Optional[str]):
+        """Record the owner of a document that was added or was already stored"""
+        if owner and result.get('success') and result.get('document'):
+            try:
+                self.document_store.add_owner(result['document']['id'], owner)
+            except Exception as e:
+                st.warning(f"Could not record the document owner: {str(e)}")
+
+    def _ingest_pdf_bytes(
+            self,
+            data: bytes,
+            doi_input: Optional[str] = None,
+            parse_pool: Optional[ProcessPoolExecutor] = None
+    ) -> Dict[str, Any]:
+        """
+        Add a PDF unless the same content is already stored.
+
+        The SHA-256 of the raw bytes identifies the document, so a re-upload of
+        the same file returns the stored document without any extraction,
+        citation or embedding work. A PDF with different bytes but the same
+        normalized text is caught after extraction by its text fingerprint.
+        """
+        file_hash = file_fingerprint(data)
+        with _fingerprint_lock(file_hash):
+            existing = self._find_document({'file_hash': file_hash})
+            if existing:
+                return self._existing_document_result(existing)
+
+            # the first range tells the page count; a short PDF is read whole by it
+            first_pages = self._submit_pages(data, 0, parse_pool).result()
+            if first_pages['num_pages'] > len(first_pages['pages']):
+                return self._stream_pdf_into_rag(data, file_hash, first_pages, doi_input, parse_pool)
+
+            stats = PdfTextStats()
+            pdf_data = parsed_pdf(stats, read_extracted_pages(stats, first_pages))
+            pdf_data['title'] = self._extract_title_from_text(pdf_data['head_text'][:2000])
+            existing = self._find_document({'fingerprint': pdf_data['fingerprint']})
+            if existing:
+                return self._existing_document_result(existing)
+
+            return self._add_parsed_pdf(pdf_data, file_hash, doi_input)
+
+    def _existing_document_result(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'success': True,
+            'document': document,
+            'message': f"✅ '{document['title'][:50]}...' is already in the RAG system"
+        }
+
+    def _find_document(self, where: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Look up a stored document by one of its fields, e.g. {'file_hash': ...}"""
+        (field, value), = where.items()
+        try:
+            return self.document_store.find(field, value)
+        except Exception:
+            return None
+
+    def _document_from_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Rebuild a stored document from the metadata of its first chunk"""
+        return {
+            'id': metadata['doc_id'],
+            'title': metadata.get('title', 'Unknown'),
+            'authors': metadata.get('authors', 'Unknown Authors'),
+            'year': metadata.get('year', 'Unknown'),
+            'journal': metadata.get('journal', 'Unknown Journal'),
+            'doi': metadata.get('doi', metadata['doc_id']),
+            'citation': metadata.get('citation', 'Unknown'),
+            'short_citation': metadata.get('short_citation', 'Unknown'),
+            'abstract': metadata.get('abstract', ''),
+            'num_pages': metadata.get('num_pages', 0),
+            'word_count': metadata.get('word_count', 0),
+            'file_hash': metadata.get('file_hash'),
+            'fingerprint': metadata.get('fingerprint'),
+            'type': 'pdf',
+            'source': 'uploaded',
+            'upload_time': metadata.get('upload_time', 0)
+        }
+
+    def _add_parsed_pdf(
+            self,
+            pdf_data: Dict[str, Any],
+            file_hash: str,
+            doi_input: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Resolve the citation of a parsed PDF and store its chunks"""
+        citation_info = self._resolve_citation(pdf_data['head_text'], file_hash, doi_input, pdf_data['doi'])
+        document = self._build_document(citation_info, pdf_data['title'], file_hash)
+        document.update({
+            'abstract': pdf_data['abstract'],  # First 500 words
+            'num_pages': pdf_data['num_pages'],
+            'word_count': pdf_data['word_count'],
+            'fingerprint': pdf_data['fingerprint']
+        })
+
+        # Store chunks in ChromaDB
+        stored_ids = self._store_chunks_in_chromadb(document, pdf_data['chunks'])
+        if len(stored_ids) < len(pdf_data['chunks']):
+            return self._incomplete_document_result(document, len(stored_ids), len(pdf_data['chunks']))
+        self._finalize_document(document, pdf_data['chunks'][:1])
+
+        return self._added_document_result(document)
+
+    def _submit_pages(
+            self,
+            data: bytes,
+            start: int,
+            parse_pool: Optional[ProcessPoolExecutor] = None
+    ) -> Future:
+        """Extract a range of STREAMING_PAGE_THRESHOLD pages, in the parse pool if there is one"""
+        args = (data, start, STREAMING_PAGE_THRESHOLD, self.text_splitter.chunk_size, self.text_splitter.chunk_overlap)
+        if parse_pool is not None:
+            return parse_pool.submit(extract_pdf_pages, *args)
+        future = Future()
+        future.set_result(extract_pdf_pages(*args))
+        return future
+
+    def _stream_pdf_into_rag(
+            self,
+            data: bytes,
+            file_hash: str,
+            first_pages: Dict[str, Any],
+            doi_input: Optional[str] = None,
+            parse_pool: Optional[ProcessPoolExecutor] = None
+    ) -> Dict[str, Any]:
+        """
+        Add a long PDF without holding its text in memory.
+
+        The pages are extracted in ranges in the parse pool, the next range
+        while the chunks of the current one are written to ChromaDB in
+        batches. Only the beginning of the text is kept, for the title and
+        citation; the abstract, word count and fingerprint are accumulated
+        as the pages go by.
+
+        :param first_pages: the first range, already extracted
+        """
+        stats = PdfTextStats()
+        num_pages = first_pages['num_pages']
+
+        def later_chunks(pending: Future, start: int) -> Iterator[Any]:
+            while pending is not None:
+                extracted = pending.result()
+                start += STREAMING_PAGE_THRESHOLD
+                pending = self._submit_pages(data, start, parse_pool) if start < num_pages else None
+                yield from read_extracted_pages(stats, extracted)
+
+        # Start on the second range now; the first holds the beginning of the
+        # text, for the title and citation
+        start = len(first_pages['pages'])
+        chunks = chain(
+            read_extracted_pages(stats, first_pages),
+            later_chunks(self._submit_pages(data, start, parse_pool), start)
+        )
+        citation_info = self._resolve_citation(stats.head_text, file_hash, doi_input, stats.doi)
+        title = self._extract_title_from_text(stats.head_text[:2000])
+        document = self._build_document(citation_info, title, file_hash)
+
+        first_chunk = []
+        batch = []
+        written_ids = []
+        expected = 0
+        for chunk in chunks:
+            if not first_chunk:
+                first_chunk = [chunk]
+            batch.append(chunk)
+            if len(batch) >= STREAM_BATCH_SIZE:
+                written_ids += self._store_chunks_in_chromadb(document, batch, expected)
+                expected += len(batch)
+                batch = []
+        written_ids += self._store_chunks_in_chromadb(document, batch, expected)
+        expected += len(batch)
+
+        # Committed chunks are kept so that uploading the file again resumes
+        if len(written_ids) < expected:
+            return self._incomplete_document_result(document, len(written_ids), expected)
+
+        document.update({
+            'abstract': stats.abstract,  # First 500 words
+            'num_pages': stats.num_pages,
+            'word_count': stats.word_count,
+            'fingerprint': stats.fingerprint
+        })
+
+        # Same text under different bytes: keep the copy that was stored first
+        existing = self._find_document({'fingerprint': stats.fingerprint})
+        if existing:
+            self._delete_chunks(written_ids)
+            return self._existing_document_result(existing)
+
+        self._finalize_document(document, first_chunk)
+        return self._added_document_result(document)
+
+    def _incomplete_document_result(self, document: Dict[str, Any], stored: int, total: int) -> Dict[str, Any]:
+        return {
+            'success': False,
+            'error': f"Stored {stored} of {total} chunks",
+            'message': f"❌ Only {stored} of {total} chunks of '{document['title'][:50]}...' were stored. "
+                       f"Upload the file again to resume."
+        }
+
+    def _resolve_citation(
+            self,
+            head_text: str,
+            file_hash: str,
+            doi_input: Optional[str] = None,
+            detected_doi: Optional[str] = None
+    ) -> Dict[str, str]:
+        """
+        Get citation information from the DOI, or from the first pages with AI.
+
+        :param doi_input: the DOI the user typed, which takes precedence
+        :param detected_doi: the DOI found in the PDF's metadata or first page,
+            used when no DOI was typed; the LLM is only asked when the DOI
+            does not resolve
+        """
+        if not (doi_input and doi_input.strip()) and detected_doi:
+            try:
+                citation_info = self._parse_citation(get_citation(detected_doi))
+                citation_info['doi'] = detected_doi
+                return citation_info
+            except Exception:
+                pass
+
+        if doi_input and doi_input.strip():
+            try:
+                full_citation = get_citation(doi_input.strip())
+                # Parse the citation to extract components
+                citation_info = self._parse_citation(full_citation)
+                citation_info['doi'] = doi_input.strip()
+            except:
+                st.warning("Could not retrieve citation from DOI, using AI extraction...")
+                citation_info = self._extract_citation_with_ai(head_text, file_hash)
+                citation_info['doi'] = doi_input.strip()
+        else:
+            citation_info = self._extract_citation_with_ai(head_text, file_hash)
+            citation_info['doi'] = f"uploaded_{file_hash[:16]}"
+        return citation_info
+
+    def _build_document(self, citation_info: Dict[str, str], title: str, file_hash: str) -> Dict[str, Any]:
+        """Create the document object kept in session state (without the full text)"""
+        # The content hash makes the document ID (and so every chunk ID) stable
+        doc_id = f"pdf_{file_hash[:16]}"
+
+        return {
+            'id': doc_id,
+            'title': citation_info.get('title', title),
+            'authors': citation_info.get('authors', 'Unknown Authors'),
+            'year': citation_info.get('year', str(time.localtime().tm_year)),
+            'journal': citation_info.get('journal', 'Unknown Journal'),
+            'doi': citation_info.get('doi', doc_id),
+            'citation': citation_info.get('full_citation', f"Unknown ({citation_info.get('year', '2024')}). {title}."),
+            'short_citation': citation_info.get('short_citation', f"Unknown, {citation_info.get('year', '2024')}"),
+            'abstract': '',
+            'num_pages': 0,
+            'word_count': 0,
+            'file_hash': file_hash,
+            'fingerprint': None,
+            'type': 'pdf',
+            'source': 'uploaded',
+            'upload_time': time.time()
+        }
+
+    def _added_document_result(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'success': True,
+            'document': document,
+            'message': f"✅ Successfully added '{document['title'][:50]}...' to RAG system ({document['num_pages']} pages, {document['word_count']} words)"
+        }
     
     def _parse_citation(self, citation: str) -> Dict[str, str]:
         """Parse a full citation string into components"""
@@ -289,122 +753,478 @@ class RAGManager:
         except:
             return self._default_citation()
     
-    def _store_chunks_in_chromadb(self, document: Dict[str, Any], chunks: List[Any]):
-        """Store PDF chunks in ChromaDB"""
+    def _chunk_metadata(self, document: Dict[str, Any], chunk: Any, chunk_index: int) -> Dict[str, Any]:
+        return {
+            'doc_id': document['id'],
+            'title': document['title'],
+            'authors': document['authors'],
+            'year': str(document['year']),
+            'journal': document['journal'],
+            'page_number': chunk.metadata['page_number'],
+            'chunk_id': chunk.metadata['chunk_id'],
+            'chunk_index': chunk_index,
+            'citation': document['citation']
+        }
+
+    def _store_chunks_in_chromadb(self, document: Dict[str, Any], chunks: List[Any], start_index: int = 0) -> List[str]:
+        """
+        Store PDF chunks in ChromaDB and return the IDs that are stored.
+
+        Chunks are embedded in token-budgeted batches; batches that fail after
+        backing off are left out of the returned IDs, and chunks stored by an
+        earlier attempt are not embedded again.
+        """
         if not self.collection:
             st.warning("ChromaDB collection not available. PDF chunks will not be stored for RAG queries.")
-            return
+            return []
+        if not chunks:
+            return []
             
         try:
             # Prepare data for ChromaDB
             documents = [chunk.page_content for chunk in chunks]
             metadatas = [
-                {
-                    'doc_id': document['id'],
-                    'title': document['title'],
-                    'authors': document['authors'],
-                    'year': str(document['year']),
-                    'journal': document['journal'],
-                    'page_number': chunk.metadata['page_number'],
-                    'chunk_id': chunk.metadata['chunk_id'],
-                    'citation': document['citation']
-                }
-                for chunk in chunks
+                self._chunk_metadata(document, chunk, start_index + offset)
+                for offset, chunk in enumerate(chunks)
             ]
             
             # Generate unique IDs for each chunk
             ids = [f"{document['id']}_{chunk.metadata['chunk_id']}" for chunk in chunks]
             
-            # Add to collection
-            self.collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
+            result = self.embedding_writer.write(self.collection, ids, documents, metadatas)
+            if not result.complete:
+                st.warning(
+                    f"Could not store {len(result.failed_ids)} of {len(ids)} PDF chunks in vector database: "
+                    f"{result.errors[0]}"
+                )
+            stored_ids = result.skipped_ids + result.written_ids
+            self.document_store.add_chunks(document['id'], stored_ids)
+            self._collection_changed()
+
+            # keep the keyword index in step with the vector store
+            stored = set(stored_ids)
+            indexed = [position for position, chunk_id in enumerate(ids) if chunk_id in stored]
+            self.lexical_index.add(
+                [ids[position] for position in indexed],
+                [documents[position] for position in indexed],
+                [document['id']] * len(indexed)
             )
+            return stored_ids
             
         except Exception as e:
             st.warning(f"Could not store PDF chunks in vector database: {str(e)}")
+            return []
+
+    def store_document(
+            self,
+            document: Dict[str, Any],
+            chunks: List[Any],
+            owner: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Store the chunks of a document and record it once they are all stored.
+
+        For callers that parse a PDF themselves; add_pdf_to_rag does all of
+        this for an uploaded file.
+
+        :param document: a document as built by this manager, e.g. one that
+            add_pdf_to_rag or get_document returned
+        :param chunks: the document's page-tagged chunks
+        :param owner: the owner the document is recorded for; defaults to the current session
+        :return: a result shaped like add_pdf_to_rag's
+        """
+        stored_ids = self._store_chunks_in_chromadb(document, chunks)
+        if len(stored_ids) < len(chunks):
+            return self._incomplete_document_result(document, len(stored_ids), len(chunks))
+        self._finalize_document(document, chunks[:1])
+        result = self._added_document_result(document)
+        self._claim_document(result, owner or _session_owner())
+        return result
+
+    def extract_citation(self, text: str) -> Dict[str, str]:
+        """Citation information of a paper from the text of its first pages, extracted with AI"""
+        return self._extract_citation_with_ai(text)
+
+    def _finalize_document(self, document: Dict[str, Any], first_chunk: List[Any]):
+        """
+        Record the document in the document store and on its first chunk.
+
+        This happens only once every chunk is stored, so that the document is
+        found by its fingerprint only when it has been completely ingested.
+        """
+        if not self.collection or not first_chunk:
+            return
+
+        chunk = first_chunk[0]
+        metadata = self._chunk_metadata(document, chunk, 0)
+        metadata.update({
+            'doi': str(document['doi']),
+            'short_citation': document['short_citation'],
+            'abstract': document['abstract'],
+            'num_pages': document['num_pages'],
+            'word_count': document['word_count'],
+            'file_hash': document['file_hash'],
+            'fingerprint': document['fingerprint'],
+            'upload_time': document['upload_time']
+        })
+        try:
+            self.collection.update(
+                ids=[f"{document['id']}_{chunk.metadata['chunk_id']}"],
+                metadatas=[metadata]
+            )
+            self.document_store.upsert(document)
+        except Exception as e:
+            st.warning(f"Could not store document details in vector database: {str(e)}")
+
+    def get_document_chunks(self, doc_id: str, limit: Optional[int] = None) -> List[str]:
+        """Return the text of a document's chunks in reading order"""
+        if not self.collection:
+            return []
+
+        where = {"doc_id": doc_id}
+        if limit:
+            where = {"$and": [where, {"chunk_index": {"$lt": limit}}]}
+
+        try:
+            results = self.collection.get(where=where, include=['documents', 'metadatas'])
+        except Exception as e:
+            st.error(f"Error retrieving document chunks: {str(e)}")
+            return []
+
+        ordered = sorted(
+            zip(results['metadatas'], results['documents']),
+            key=lambda item: item[0].get('chunk_index', 0)
+        )
+        return [text for _, text in ordered]
+
+    def _delete_chunks(self, ids: List[str]):
+        if self.collection and ids:
+            self.collection.delete(ids=ids)
+            self.lexical_index.remove(ids)
+            self.document_store.remove_chunks(ids)
+            self._collection_changed()
+            self._record_churn(len(ids))
+
+    def _collection_changed(self):
+        """Drop cached query results and chunk vectors after chunks were added or removed"""
+        get_query_cache().invalidate('rag')
+        with self._doc_vectors_lock:
+            self._doc_vectors.clear()
     
     def query_rag(self, query: str, top_k: int = 5, doc_ids: Optional[List[str]] = None) -> Dict[str, Any]:
-        """Query the RAG system for relevant content"""
+        """
+        Query the RAG system for relevant content.
+
+        Dense similarity from ChromaDB and BM25 from the lexical index are
+        fused with reciprocal rank fusion, so exact terms such as "ASC 606"
+        or author names are found even when the embeddings miss them. Quoted
+        phrases in the query must all appear in a chunk; they are matched in
+        the index rather than by scanning the stored chunks. The best fused
+        candidates are then reranked and only the top_k are returned.
+        """
+        return self.query_rag_batch([{'query': query, 'top_k': top_k, 'doc_ids': doc_ids}])[0]
+
+    def query_rag_batch(self, requests: List[Any], top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Answer several RAG queries with one embedding request.
+
+        All query texts are embedded together, queries that share the same
+        filter are sent to ChromaDB as one vectorized query, and the chunks
+        of every result are fetched in one read, so N questions (one per
+        theme or per document) cost about one round trip.
+
+        :param requests: query strings, or dicts with a 'query' and optional
+            'top_k' and 'doc_ids' for that query
+        :param top_k: number of results for requests that do not set their own
+        :return: one result per request, in order, shaped like query_rag's
+        """
+        requests = [request if isinstance(request, dict) else {'query': request} for request in requests]
         if not self.collection:
-            return {
-                'success': False,
-                'error': 'ChromaDB collection not available',
-                'results': [],
+            return [
+                self._query_response(request['query'], error='ChromaDB collection not available')
+                for request in requests
+            ]
+
+        # repeated questions are answered from the query cache until the collection changes
+        query_cache = get_query_cache()
+        version = query_cache.version('rag')
+
+        responses = [None] * len(requests)
+        pending = []
+        for position, request in enumerate(requests):
+            query = request['query']
+            doc_ids = request.get('doc_ids')
+            item = {
+                'position': position,
                 'query': query,
-                'total_results': 0
+                'top_k': request.get('top_k') or top_k,
+                'doc_ids': doc_ids,
+                'phrase_ids': None,
             }
-            
+            item['filters'] = {'top_k': item['top_k'], 'doc_ids': sorted(doc_ids) if doc_ids else None}
+            cached = query_cache.get('rag', query, item['filters'], version=version)
+            if cached is not None:
+                cached['query'] = query
+                responses[position] = cached
+                continue
+
+            try:
+                # exact phrases restrict both retrievers to the chunks that contain them
+                phrases = re.findall(r'"([^"]+)"', query)
+                if phrases:
+                    item['phrase_ids'] = self.lexical_index.match(phrases, "AND", groups=doc_ids)
+                    if not item['phrase_ids']:
+                        responses[position] = self._query_response(query, [])
+                        continue
+            except Exception as e:
+                responses[position] = self._query_response(query, error=str(e))
+                continue
+            pending.append(item)
+
+        if not pending:
+            return responses
+
         try:
+            self._dense_search(pending)
+
+            # fuse the rankings of each query, then read every candidate chunk at once
+            for item in pending:
+                candidates = self._candidate_count(item['top_k'])
+                lexical_ranking = [
+                    chunk_id for chunk_id, _ in self.lexical_index.search(
+                        item['query'], candidates, groups=item['doc_ids'], restrict_to=item['phrase_ids']
+                    )
+                ]
+                item['fused'] = reciprocal_rank_fusion(
+                    [item['dense_ranking'], lexical_ranking]
+                )[:self._rerank_count(item['top_k'])]
+
+            chunk_ids = list(dict.fromkeys(chunk_id for item in pending for chunk_id, _ in item['fused']))
+            records = self.collection.get(ids=chunk_ids, include=['documents', 'metadatas'])
+            by_id = {
+                chunk_id: (doc, metadata)
+                for chunk_id, doc, metadata in zip(records['ids'], records['documents'], records['metadatas'])
+            }
+        except Exception as e:
+            for item in pending:
+                responses[item['position']] = self._query_response(item['query'], error=str(e))
+            return responses
+
+        for item in pending:
+            # Format results
+            formatted_results = []
+            for chunk_id, score in item['fused']:
+                if chunk_id not in by_id:
+                    continue
+                doc, metadata = by_id[chunk_id]
+                formatted_results.append({
+                    'content': doc,
+                    'metadata': metadata,
+                    'relevance_score': score,
+                    'distance': item['distances'].get(chunk_id)
+                })
+
+            # second stage: rerank the wide candidate set and keep only the best few
+            reranker = _get_reranker()
+            try:
+                formatted_results = (
+                    reranker.rerank(item['query'], formatted_results, item['top_k'])
+                    if reranker else formatted_results[:item['top_k']]
+                )
+            except Exception:
+                formatted_results = formatted_results[:item['top_k']]
+
+            response = self._query_response(item['query'], formatted_results)
+            query_cache.put('rag', item['query'], item['filters'], response, version=version)
+            responses[item['position']] = response
+
+        return responses
+
+    def _rerank_count(self, top_k: int) -> int:
+        """Fused candidates to read: a wide set for the reranker, or just top_k without one"""
+        return max(top_k, RERANK_CANDIDATES) if _get_reranker() else top_k
+
+    def _candidate_count(self, top_k: int) -> int:
+        return max(top_k * HYBRID_CANDIDATE_FACTOR, HYBRID_MIN_CANDIDATES, self._rerank_count(top_k))
+
+    def _dense_search(self, items: List[Dict[str, Any]]):
+        """
+        Run the vector search of several queries, adding 'dense_ranking' and
+        'distances' to each item.
+
+        The query texts are embedded in one request and every group of queries
+        with the same filter is one ChromaDB query.
+        """
+        embeddings = openai_ef([item['query'] for item in items])
+
+        groups = {}
+        for item, embedding in zip(items, embeddings):
+            key = (
+                tuple(sorted(item['doc_ids'])) if item['doc_ids'] else None,
+                tuple(sorted(item['phrase_ids'])) if item['phrase_ids'] is not None else None,
+            )
+            groups.setdefault(key, []).append((item, embedding))
+
+        for (doc_ids, phrase_ids), members in groups.items():
+            if doc_ids and self._scoped_search(doc_ids, phrase_ids, members):
+                continue
+
             # Prepare filters
-            where_filter = None
+            query_args = dict(
+                query_embeddings=[embedding for _, embedding in members],
+                n_results=max(self._candidate_count(item['top_k']) for item, _ in members),
+                include=['distances']
+            )
             if doc_ids:
-                where_filter = {"doc_id": {"$in": doc_ids}}
-            
+                query_args['where'] = {"doc_id": {"$in": list(doc_ids)}}
+            if phrase_ids is not None:
+                query_args['ids'] = list(phrase_ids)
+
             # Perform search
-            results = self.collection.query(
-                query_texts=[query],
-                where=where_filter,
-                n_results=top_k
-            )
-            
-            # Format results
-            formatted_results = []
-            if results['documents'] and results['documents'][0]:
-                for i, (doc, metadata) in enumerate(zip(results['documents'][0], results['metadatas'][0])):
-                    formatted_results.append({
-                        'content': doc,
-                        'metadata': metadata,
-                        'relevance_score': results['distances'][0][i] if 'distances' in results else 0
-                    })
-            
-            return {
-                'success': True,
-                'results': formatted_results,
-                'query': query,
-                'total_results': len(formatted_results)
-            }
-            
-        except Exception as e:
+            dense = self.collection.query(**query_args)
+            for row, (item, _) in enumerate(members):
+                ranking = dense['ids'][row] if dense['ids'] else []
+                item['dense_ranking'] = ranking
+                item['distances'] = dict(zip(ranking, dense['distances'][row])) if dense.get('distances') else {}
+
+    def _document_vectors(self, doc_ids: Tuple[str, ...]) -> Optional[Tuple[List[str], np.ndarray]]:
+        """
+        The chunk IDs and unit-length vectors of the given documents.
+
+        Chunk IDs come from the lexical index, or from the document store for
+        documents the index does not cover, so nothing outside the documents
+        is read. Returns None when the documents are too large for exact
+        search, or when the chunks of a document are not known at all, so the
+        caller falls back to a filtered ANN query instead of finding nothing.
+        """
+        with self._doc_vectors_lock:
+            cached = {doc_id: self._doc_vectors[doc_id] for doc_id in doc_ids if doc_id in self._doc_vectors}
+            for doc_id in cached:
+                self._doc_vectors.move_to_end(doc_id)
+
+        missing = [doc_id for doc_id in doc_ids if doc_id not in cached]
+        if missing:
+            chunk_ids = self.lexical_index.group_ids(missing)
+            for doc_id in missing:
+                if not chunk_ids[doc_id]:
+                    chunk_ids[doc_id] = self.document_store.chunk_ids(doc_id)
+                    if not chunk_ids[doc_id]:
+                        return None
+            total = sum(len(ids) for ids in chunk_ids.values()) + sum(len(ids) for ids, _ in cached.values())
+            if total > SCOPED_SEARCH_MAX_CHUNKS:
+                return None
+
+            wanted = [chunk_id for ids in chunk_ids.values() for chunk_id in ids]
+            records = self.collection.get(ids=wanted, include=['embeddings', 'metadatas']) if wanted else None
+            loaded = {doc_id: ([], []) for doc_id in missing}
+            if records is not None:
+                for chunk_id, embedding, metadata in zip(records['ids'], records['embeddings'], records['metadatas']):
+                    ids, vectors = loaded[metadata['doc_id']]
+                    ids.append(chunk_id)
+                    vectors.append(embedding)
+
+            with self._doc_vectors_lock:
+                for doc_id, (ids, vectors) in loaded.items():
+                    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+                    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                    matrix = matrix / np.where(norms == 0, 1, norms)
+                    cached[doc_id] = self._doc_vectors[doc_id] = (ids, matrix)
+                while len(self._doc_vectors) > SCOPED_VECTOR_CACHE_SIZE:
+                    self._doc_vectors.popitem(last=False)
+
+        ids = [chunk_id for doc_id in doc_ids for chunk_id in cached[doc_id][0]]
+        matrices = [cached[doc_id][1] for doc_id in doc_ids if len(cached[doc_id][0])]
+        if not matrices:
+            return ids, np.empty((0, 0), dtype=np.float32)
+        return ids, np.vstack(matrices)
+
+    def _scoped_search(
+            self,
+            doc_ids: Tuple[str, ...],
+            phrase_ids: Optional[Tuple[str, ...]],
+            members: List[Tuple[Dict[str, Any], Any]]
+    ) -> bool:
+        """
+        Exact cosine search over only the chunks of the given documents.
+
+        Only the vectors the queries are allowed to return are scored, so the
+        cost does not depend on what else is in the shared collection and
+        every query gets up to its full number of candidates.
+
+        :return: False if the scope is too large and the ANN index should be used
+        """
+        scope = self._document_vectors(doc_ids)
+        if scope is None:
+            return False
+        ids, matrix = scope
+        if phrase_ids is not None:
+            allowed = set(phrase_ids)
+            keep = [position for position, chunk_id in enumerate(ids) if chunk_id in allowed]
+            ids = [ids[position] for position in keep]
+            matrix = matrix[keep] if len(keep) else np.empty((0, 0), dtype=np.float32)
+
+        for item, embedding in members:
+            if not ids:
+                item['dense_ranking'], item['distances'] = [], {}
+                continue
+            query = np.asarray(embedding, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            distances = 1.0 - matrix @ query
+            order = np.argsort(distances)[:self._candidate_count(item['top_k'])]
+            item['dense_ranking'] = [ids[position] for position in order]
+            item['distances'] = {ids[position]: float(distances[position]) for position in order}
+        return True
+
+    def _query_response(
+            self,
+            query: str,
+            results: Optional[List[Dict[str, Any]]] = None,
+            error: Optional[str] = None
+    ) -> Dict[str, Any]:
+        if error is not None:
             return {
                 'success': False,
-                'error': str(e),
+                'error': error,
                 'results': [],
                 'query': query,
                 'total_results': 0
             }
+        return {
+            'success': True,
+            'results': results,
+            'query': query,
+            'total_results': len(results)
+        }
     
-    def get_all_documents(self) -> List[Dict[str, Any]]:
-        """Get all documents in the RAG system"""
+    def get_all_documents(self, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get all documents in the RAG system.
+
+        :param owner: only list the documents of this owner
+        """
         if not self.collection:
             return []
             
         try:
-            # Get all unique document IDs
-            all_results = self.collection.get()
-            doc_ids = set()
-            documents = []
-            
-            if all_results['metadatas']:
-                for metadata in all_results['metadatas']:
-                    doc_id = metadata.get('doc_id')
-                    if doc_id and doc_id not in doc_ids:
-                        doc_ids.add(doc_id)
-                        documents.append({
-                            'id': doc_id,
-                            'title': metadata.get('title', 'Unknown'),
-                            'authors': metadata.get('authors', 'Unknown'),
-                            'year': metadata.get('year', 'Unknown'),
-                            'journal': metadata.get('journal', 'Unknown'),
-                            'citation': metadata.get('citation', 'Unknown')
-                        })
-            
-            return documents
+            return self.document_store.list(owner)
             
         except Exception as e:
             st.error(f"Error retrieving documents: {str(e)}")
             return []
+
+    def count_documents(self) -> int:
+        """Number of documents in the RAG system"""
+        try:
+            return self.document_store.count()
+        except Exception:
+            return 0
+
+    def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Look up one document by its ID"""
+        try:
+            return self.document_store.get(doc_id)
+        except Exception:
+            return None
     
     def remove_document(self, doc_id: str) -> bool:
         """Remove a document and all its chunks from the RAG system"""
@@ -412,37 +1232,94 @@ class RAGManager:
             return False
             
         try:
-            # Get all chunk IDs for this document
-            results = self.collection.get(where={"doc_id": doc_id})
-            
-            if results['ids']:
-                # Delete all chunks for this document
-                self.collection.delete(ids=results['ids'])
-                return True
-            return False
+            # the sidecars know the chunk IDs, so nothing is searched for
+            chunk_ids = self.document_store.chunk_ids(doc_id) or self.lexical_index.group_ids([doc_id])[doc_id]
+            if chunk_ids:
+                self.collection.delete(ids=chunk_ids)
+            else:
+                # documents stored before chunk IDs were recorded
+                self.collection.delete(where={"doc_id": doc_id})
+            self.lexical_index.remove_group(doc_id)
+            removed = self.document_store.remove(doc_id)
+            self._collection_changed()
+            self._record_churn(len(chunk_ids))
+            return removed
             
         except Exception as e:
             st.error(f"Error removing document: {str(e)}")
             return False
     
-    def clear_all_documents(self) -> bool:
-        """Clear all documents from the RAG system"""
-        if not self.collection or 'rag_client' not in st.session_state:
+    def clear_all_documents(self, owner: Optional[str] = None) -> bool:
+        """
+        Clear one owner's documents from the RAG system.
+
+        Documents that another owner also uploaded are kept for them; the
+        shared collection itself is never dropped.
+
+        :param owner: whose documents to clear; defaults to the current session
+        """
+        owner = owner or _session_owner()
+        if not self.collection or not owner:
             return False
             
         try:
-            # Delete the collection and recreate it
-            st.session_state.rag_client.delete_collection("research_papers")
-            self.collection = st.session_state.rag_client.get_or_create_collection(
-                "research_papers",
-                embedding_function=openai_ef
-            )
+            for doc_id in self.document_store.owned_documents(owner):
+                if self.document_store.remove_owner(doc_id, owner) == 0:
+                    self.remove_document(doc_id)
             return True
             
         except Exception as e:
             st.error(f"Error clearing documents: {str(e)}")
             return False
 
+    def _expire_anonymous_owners(self):
+        """Remove the documents whose only owners were anonymous sessions that expired"""
+        try:
+            expired = self.document_store.expire_owners(
+                ANONYMOUS_OWNER_PREFIX, time.time() - ANONYMOUS_OWNER_TTL
+            )
+            for doc_id in expired:
+                self.remove_document(doc_id)
+        except Exception as e:
+            print(f"Expiring anonymous documents failed: {e}")
+
+    def _record_churn(self, deleted_chunks: int):
+        """Start a background compaction once enough chunks were deleted"""
+        # deletions are recorded by the concurrent ingestion workers
+        with self._churn_lock:
+            self._churn += deleted_chunks
+            if self._churn < COMPACTION_CHURN:
+                return
+            self._churn = 0
+        threading.Thread(target=self.compact, name="rag-compaction", daemon=True).start()
+
+    def compact(self):
+        """
+        Remove leftovers of deleted documents and reclaim the sidecars' space.
+
+        Documents left behind by expired anonymous sessions are removed,
+        chunk IDs recorded for documents that were never completed are dropped
+        when their chunks are no longer in the collection, then the lexical
+        index and the document store are vacuumed. Runs at most once at a time.
+        """
+        if not self._compaction_lock.acquire(blocking=False):
+            return
+        try:
+            self._expire_anonymous_owners()
+            for doc_id in self.document_store.unfinished_documents():
+                chunk_ids = self.document_store.chunk_ids(doc_id)
+                present = set(self.collection.get(ids=chunk_ids, include=[])['ids']) if chunk_ids else set()
+                orphans = [chunk_id for chunk_id in chunk_ids if chunk_id not in present]
+                if orphans:
+                    self.document_store.remove_chunks(orphans)
+                    self.lexical_index.remove(orphans)
+            self.lexical_index.vacuum()
+            self.document_store.vacuum()
+        except Exception as e:
+            print(f"RAG compaction failed: {e}")
+        finally:
+            self._compaction_lock.release()
+
 # Global instance
 @st.cache_resource
 def get_rag_manager():
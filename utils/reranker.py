@@ -0,0 +1,236 @@
+"""
+Second-stage rerankers for RAG candidates.
+
+The first stage (hybrid retrieval) fetches a wide candidate set cheaply; a
+reranker then scores each (query, chunk) pair more carefully so only the best
+few chunks reach the prompt. The reranker's order is blended with the first
+stage's fused order rather than replacing it, so the dense signal is kept.
+Rerankers are interchangeable: ``CrossEncoderReranker`` runs a small
+sentence-transformers cross-encoder on CPU when that package is installed,
+``LexicalReranker`` needs nothing beyond the standard library but only sees
+the words, so it counts for as much as the fused order. ``CachedReranker``
+keeps the scores of pairs it has already seen.
+
+Run ``python -m utils.reranker`` to measure the latency each reranker adds to
+a query.
+"""
+import hashlib
+import math
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+from utils.lexical_index import BM25_B, BM25_K1, tokenize
+
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# damping constant of the rank blend, as in reciprocal rank fusion
+RANK_CONSTANT = 60
+
+
+class Reranker:
+    """Scores how well each text answers a query; higher is better"""
+
+    name = "reranker"
+
+    # whether a text's score depends only on the query and the text itself,
+    # and not on the other candidates it is scored with
+    pointwise = True
+
+    # weight of the first-stage (fused) order in the final order; the
+    # reranker's own order gets the rest
+    fusion_weight = 0.3
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        raise NotImplementedError
+
+    def rerank(self, query: str, results: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """
+        Reorder query_rag results by blending their first-stage and rerank ranks.
+
+        :param query: the user's question
+        :param results: results with a 'content' key, in first-stage (fused) order
+        :param top_k: the number of results to keep
+        :return: the best results, each with a 'rerank_score'
+        """
+        if not results:
+            return []
+        scores = self.score(query, [result['content'] for result in results])
+        by_score = sorted(range(len(results)), key=lambda position: scores[position], reverse=True)
+        rerank_rank = {position: rank for rank, position in enumerate(by_score)}
+        blended = sorted(
+            range(len(results)),
+            key=lambda position: (
+                self.fusion_weight / (RANK_CONSTANT + position + 1)
+                + (1 - self.fusion_weight) / (RANK_CONSTANT + rerank_rank[position] + 1)
+            ),
+            reverse=True
+        )
+        return [{**results[position], 'rerank_score': scores[position]} for position in blended[:top_k]]
+
+
+class LexicalReranker(Reranker):
+    """
+    BM25 over the candidate set, plus credit for covering every query term and
+    for query word pairs that appear next to each other in the chunk.
+    """
+
+    name = "lexical"
+    pointwise = False
+    fusion_weight = 0.5
+
+    def __init__(self, coverage_weight: float = 1.0, proximity_weight: float = 0.5):
+        self.coverage_weight = coverage_weight
+        self.proximity_weight = proximity_weight
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not texts:
+            return [0.0] * len(texts)
+        pairs = set(zip(terms, terms[1:]))
+
+        tokenized = [tokenize(text) for text in texts]
+        average_length = sum(len(tokens) for tokens in tokenized) / len(tokenized) or 1.0
+        counts = [Counter(tokens) for tokens in tokenized]
+        document_frequency = {term: sum(1 for count in counts if term in count) for term in terms}
+
+        scores = []
+        for tokens, count in zip(tokenized, counts):
+            bm25 = 0.0
+            for term in terms:
+                tf = count.get(term, 0)
+                if not tf:
+                    continue
+                df = document_frequency[term]
+                idf = math.log(1 + (len(texts) - df + 0.5) / (df + 0.5))
+                bm25 += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / average_length))
+            coverage = sum(1 for term in terms if term in count) / len(terms)
+            adjacent = sum(1 for pair in zip(tokens, tokens[1:]) if pair in pairs)
+            scores.append(bm25 + self.coverage_weight * coverage + self.proximity_weight * math.log1p(adjacent))
+        return scores
+
+
+class CrossEncoderReranker(Reranker):
+    """A sentence-transformers cross-encoder, run locally on CPU"""
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = DEFAULT_CROSS_ENCODER, batch_size: int = 16):
+        # optional dependency: raises ImportError when sentence-transformers is missing
+        from sentence_transformers import CrossEncoder
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = CrossEncoder(model_name, device="cpu")
+        self.name = f"cross-encoder:{model_name}"
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        if not texts:
+            return []
+        scores = self._model.predict([(query, text) for text in texts], batch_size=self.batch_size)
+        return [float(score) for score in scores]
+
+
+class CachedReranker(Reranker):
+    """Wraps a reranker with an LRU cache of (query, text) scores"""
+
+    def __init__(self, reranker: Reranker, max_entries: int = 20000):
+        self.reranker = reranker
+        self.name = reranker.name
+        self.fusion_weight = reranker.fusion_weight
+        self.max_entries = max_entries
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(*parts: str) -> str:
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        if self.reranker.pointwise:
+            keys = [self._key(query, text) for text in texts]
+        else:
+            # set-dependent scores are only reused for the same candidate set
+            candidate_set = self._key(*sorted(texts))
+            keys = [self._key(query, text, candidate_set) for text in texts]
+        with self._lock:
+            known = {key: self._scores[key] for key in keys if key in self._scores}
+            for key in known:
+                self._scores.move_to_end(key)
+
+        missing = [position for position, key in enumerate(keys) if key not in known]
+        if missing:
+            if not self.reranker.pointwise:
+                # scores depend on the whole candidate set, so score it together
+                fresh = self.reranker.score(query, texts)
+                fresh = [fresh[position] for position in missing]
+            else:
+                fresh = self.reranker.score(query, [texts[position] for position in missing])
+            with self._lock:
+                for position, score in zip(missing, fresh):
+                    known[keys[position]] = score
+                    self._scores[keys[position]] = score
+                while len(self._scores) > self.max_entries:
+                    self._scores.popitem(last=False)
+
+        return [known[key] for key in keys]
+
+
+def create_reranker(kind: Optional[str] = None, model_name: Optional[str] = None) -> Optional[Reranker]:
+    """
+    Build the configured reranker behind a score cache.
+
+    :param kind: "cross-encoder" or "lexical"; anything else, or a
+        cross-encoder without sentence-transformers installed, means no
+        reranker and the first-stage order is kept
+    :param model_name: the cross-encoder model
+    """
+    if kind == "cross-encoder":
+        try:
+            return CachedReranker(CrossEncoderReranker(model_name or DEFAULT_CROSS_ENCODER))
+        except ImportError:
+            return None
+    if kind == "lexical":
+        return CachedReranker(LexicalReranker())
+    return None
+
+
+def _benchmark(queries: int = 50, candidates: int = 50, chunk_words: int = 180):
+    """Print the latency a reranker adds per query for a typical candidate set"""
+    import random
+    import statistics
+    import time
+
+    random.seed(0)
+    vocabulary = [f"term{number}" for number in range(5000)] + [
+        "audit", "quality", "earnings", "management", "sox", "404", "asc", "606", "revenue", "disclosure"
+    ]
+    texts = [" ".join(random.choices(vocabulary, k=chunk_words)) for _ in range(candidates)]
+    questions = [" ".join(random.choices(vocabulary[-10:], k=4)) for _ in range(queries)]
+
+    rerankers = [LexicalReranker()]
+    try:
+        rerankers.append(CrossEncoderReranker())
+    except ImportError:
+        print("sentence-transformers is not installed; skipping the cross-encoder")
+
+    for reranker in rerankers:
+        for label, scorer in (("uncached", reranker), ("cached", CachedReranker(reranker))):
+            if label == "cached":
+                # warm the cache the way repeated questions would
+                for question in questions:
+                    scorer.score(question, texts)
+            timings = []
+            for question in questions:
+                start = time.perf_counter()
+                scorer.score(question, texts)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            print(
+                f"{reranker.name:>40} {label:>8}: "
+                f"mean {statistics.mean(timings):7.2f} ms, "
+                f"p95 {timings[int(len(timings) * 0.95) - 1]:7.2f} ms "
+                f"({candidates} candidates of {chunk_words} words)"
+            )
+
+
+if __name__ == "__main__":
+    _benchmark()
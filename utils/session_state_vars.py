@@ -3,6 +3,7 @@ import streamlit as st
 import json
 from utils.local_storage import initialize_local_storage
 import zipfile
+import uuid
 import json
 
 
@@ -123,6 +124,11 @@ def ensure_session_state_vars():
     if 'rag_query_results' not in st.session_state:
         st.session_state.rag_query_results = []
 
+    # owner of the PDFs an anonymous session uploads to the shared RAG
+    # collection; signed-in users own theirs by user ID instead
+    if 'rag_owner' not in st.session_state:
+        st.session_state.rag_owner = f"anon:{uuid.uuid4().hex}"
+
 
 def bulk_search_column_order():
     return [
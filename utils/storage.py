@@ -0,0 +1,60 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from typing import Dict, Tuple
+
+
+def data_path(*parts: str) -> str:
+    """
+    Build a path inside the application's data directory.
+
+    The directory defaults to a folder in the system temp directory and can be
+    moved to durable storage by setting the ``AIRA_DATA_DIR`` environment variable.
+
+    :param parts: path components relative to the data directory
+    :return: the absolute path; parent directories are created if needed
+    """
+    base_dir = os.environ.get("AIRA_DATA_DIR") or os.path.join(tempfile.gettempdir(), "aira_data")
+    path = os.path.join(base_dir, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+# SQLite limits the number of bound parameters per statement, so lookups of
+# many keys are split into batches of this many
+SQLITE_LOOKUP_BATCH = 500
+
+_sqlite_connections: Dict[str, Tuple[sqlite3.Connection, threading.Lock]] = {}
+_sqlite_connections_lock = threading.Lock()
+
+
+def open_sqlite(path: str, schema: str = "") -> Tuple[sqlite3.Connection, threading.Lock]:
+    """
+    The process's connection to a SQLite file, and the lock that guards it.
+
+    Stores that keep their tables in the same file share one connection and
+    one lock, so their transactions never interleave. The file is put in WAL
+    mode, which lets other processes read it while this one writes. Every
+    ``:memory:`` path gets a private database of its own.
+
+    :param path: the database file, or ``:memory:``
+    :param schema: statements that create the caller's tables if they are missing
+    :return: the connection and the lock to hold while using it
+    """
+    with _sqlite_connections_lock:
+        key = None if path == ":memory:" else os.path.abspath(path)
+        if key in _sqlite_connections:
+            conn, lock = _sqlite_connections[key]
+        else:
+            conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            lock = threading.Lock()
+            if key is not None:
+                _sqlite_connections[key] = conn, lock
+
+    if schema:
+        with lock:
+            conn.executescript(schema)
+            conn.commit()
+    return conn, lock
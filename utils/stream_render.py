@@ -0,0 +1,84 @@
+"""
+Throttled rendering of streamed AI responses.
+
+Re-rendering the whole markdown for every token makes a long answer cost
+quadratic render work and sends thousands of websocket deltas. The renderer
+collects deltas in a list and only redraws the placeholder once per frame,
+then draws the final text exactly once when the stream ends.
+"""
+import time
+from typing import Callable, Iterable, Optional
+
+# seconds between frames and characters that force a frame early
+FRAME_INTERVAL = 0.05
+FRAME_CHARS = 400
+
+
+class StreamRenderer:
+    """Coalesces streamed deltas into time- or size-based frames"""
+
+    def __init__(
+            self,
+            placeholder,
+            interval: float = FRAME_INTERVAL,
+            max_chars: int = FRAME_CHARS,
+            on_start: Optional[Callable[[], None]] = None,
+    ):
+        """
+        :param placeholder: the st.empty() placeholder the response is drawn in
+        :param interval: minimum seconds between two frames
+        :param max_chars: pending characters that trigger a frame before the interval elapses
+        :param on_start: called once when the first delta arrives
+        """
+        self.placeholder = placeholder
+        self.interval = interval
+        self.max_chars = max_chars
+        self.on_start = on_start
+        self._parts = []
+        self._pending = 0
+        self._last_frame = 0.0
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts).strip()
+
+    def write(self, delta: str):
+        """Buffer a delta and draw a frame if one is due"""
+        if not delta:
+            return
+        if not self._parts and self.on_start is not None:
+            self.on_start()
+        self._parts.append(delta)
+        self._pending += len(delta)
+
+        now = time.monotonic()
+        if self._pending >= self.max_chars or now - self._last_frame >= self.interval:
+            self.placeholder.markdown(self.text)
+            self._pending = 0
+            self._last_frame = now
+
+    def finish(self) -> str:
+        """Draw the final text once and return it"""
+        text = self.text
+        self.placeholder.markdown(text)
+        self._pending = 0
+        return text
+
+
+def render_stream(
+        placeholder,
+        deltas: Iterable[str],
+        on_start: Optional[Callable[[], None]] = None,
+) -> str:
+    """
+    Render a stream of deltas into a placeholder with throttled frames.
+
+    :param placeholder: the st.empty() placeholder the response is drawn in
+    :param deltas: the streamed pieces of the response
+    :param on_start: called once when the first delta arrives
+    :return: the full response text
+    """
+    renderer = StreamRenderer(placeholder, on_start=on_start)
+    for delta in deltas:
+        renderer.write(delta)
+    return renderer.finish()
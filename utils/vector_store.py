@@ -0,0 +1,151 @@
+import os
+import threading
+from typing import Dict, Optional
+import streamlit as st
+from utils.storage import data_path
+
+# SQLite module replacement for ChromaDB compatibility
+try:
+    import sys
+    __import__('pysqlite3')
+    sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+except ImportError:
+    pass  # If pysqlite3 is not available, use default sqlite3
+
+try:
+    import chromadb
+    CHROMADB_AVAILABLE = True
+except ImportError:
+    CHROMADB_AVAILABLE = False
+
+try:
+    import fcntl
+except ImportError:
+    # Windows locks files through msvcrt instead
+    fcntl = None
+    import msvcrt
+
+# directory of the uploaded-PDF store, inside the data directory (AIRA_DATA_DIR)
+RAG_STORE_DIR = "chromadb"
+
+# lock files held by this process, by store directory
+_held_locks: Dict[str, object] = {}
+
+
+class StoreLockedError(RuntimeError):
+    """The local store directory is held by another process"""
+
+
+class VectorStore:
+    """
+    The process-wide ChromaDB client behind the RAG engine.
+
+    One client is created per process and shared by every Streamlit session,
+    so sessions never open the same directory twice. The data lives under the
+    configurable data directory (``AIRA_DATA_DIR``), so a restarted container
+    that mounts the same directory reuses the stored embeddings. Set
+    ``CHROMA_HOST`` (and optionally ``CHROMA_PORT``) in secrets to use a
+    ChromaDB server instead, e.g. when several app processes share one store.
+
+    The SQLite sidecars (lexical index, document list, caches) stay in the
+    data directory either way. With a server, every app process must run on
+    one host with the same ``AIRA_DATA_DIR``, so they all open the same
+    sidecar files; processes on other hosts would keep sidecars that no
+    longer match the shared collection.
+    """
+
+    def __init__(self, path: Optional[str] = None, host: Optional[str] = None, port: int = 8000):
+        """
+        :param path: directory of the persistent client, or None for an in-memory client
+        :param host: ChromaDB server to connect to instead of a local directory
+        :param port: port of the ChromaDB server
+        """
+        self.path = path
+        self.host = host
+        self._collections: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+        if host:
+            self.client = chromadb.HttpClient(host=host, port=port)
+        elif path:
+            os.makedirs(path, exist_ok=True)
+            _lock_directory(path)
+            self.client = chromadb.PersistentClient(path=path)
+        else:
+            self.client = chromadb.Client()
+
+    @property
+    def persistent(self) -> bool:
+        return bool(self.host or self.path)
+
+    def sidecar_path(self, name: str) -> str:
+        """
+        Where a SQLite sidecar of this store's collections is kept.
+
+        Sidecars of a durable store live in the data directory next to it,
+        shared by the processes of a ChromaDB server store; an in-memory store
+        gets in-memory sidecars, so it never touches the files that describe
+        another process's durable store.
+        """
+        return data_path(name) if self.persistent else ":memory:"
+
+    def collection(self, name: str, embedding_function=None):
+        """Get or create a collection; the handle is shared by all sessions"""
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = self.client.get_or_create_collection(
+                    name,
+                    embedding_function=embedding_function
+                )
+            return self._collections[name]
+
+
+def _lock_directory(path: str):
+    """
+    Hold an exclusive lock on a store directory for the life of the process.
+
+    A local ChromaDB directory must not be written by two processes at once;
+    a second process fails here instead of corrupting the store.
+    """
+    if path in _held_locks:
+        return
+    lock_file = open(os.path.join(path, ".aira.lock"), "w")
+    try:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock_file.close()
+        raise StoreLockedError(
+            f"The vector store at {path} is in use by another process. "
+            f"Set CHROMA_HOST to share a ChromaDB server between the processes of this host."
+        )
+    _held_locks[path] = lock_file
+
+
+@st.cache_resource
+def get_vector_store() -> Optional[VectorStore]:
+    """
+    The vector store of this process.
+
+    Falls back to an in-memory client, whose data is lost on restart, when
+    the durable store cannot be opened. A store that is locked by another
+    process raises StoreLockedError instead: that store is healthy and in use,
+    and an empty stand-in would only hide its documents.
+    """
+    if not CHROMADB_AVAILABLE:
+        return None
+
+    host = st.secrets.get("CHROMA_HOST")
+    port = int(st.secrets.get("CHROMA_PORT", 8000))
+    try:
+        return VectorStore(data_path(RAG_STORE_DIR), host=host, port=port)
+    except StoreLockedError:
+        raise
+    except Exception as e:
+        st.warning(f"Persistent vector store failed: {e}. Trying in-memory client...")
+
+    store = VectorStore()
+    st.info("📝 Using ChromaDB in-memory client (data will not persist)")
+    return store